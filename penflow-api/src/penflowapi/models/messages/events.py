@@ -29,7 +29,7 @@ class FlowFinishedPrematurely(messages.Message):
     def from_dict(cls, data: dict[str, Any]) -> Self:
         return cls(
             execution_id=data["executionId"],
-            detail=data["detail"],
+            detail=data["reason"],
             timestamp=data.get("timestamp"),
         )
 
@@ -65,18 +65,21 @@ class FlowFinished(messages.Message):
     execution_id: str  # Required
     success: bool  # Required
     detail: str | None  # Optional
+    critical_path: int | None  # Optional
 
     def __init__(
         self,
         execution_id: str,
         success: bool = True,
         timestamp: str | None = None,
-        detail: str | None = None
+        detail: str | None = None,
+        critical_path: int | None = None
     ):
         super().__init__(type=messages.MessageType.FLOW_FINISHED, timestamp=timestamp)
         self.execution_id = execution_id
         self.success = success
         self.detail = detail
+        self.critical_path = critical_path
 
     @property
     @override
@@ -84,7 +87,8 @@ class FlowFinished(messages.Message):
         return {
             "executionId": self.execution_id,
             "success": self.success,
-            "detail": self.detail
+            "detail": self.detail,
+            "criticalPath": self.critical_path
         }
 
     @classmethod
@@ -94,6 +98,7 @@ class FlowFinished(messages.Message):
             execution_id=data["executionId"],
             success=data["success"],
             detail=data.get("detail"),
+            critical_path=data.get("criticalPath"),
             timestamp=data.get("timestamp"),
         )
 
@@ -141,6 +146,7 @@ class TaskFinished(messages.Message):
     output: dict  # Optional
     steps: list  # Optional
     detail: str | None  # Optional
+    cached: bool  # Optional
 
     def __init__(
         self,
@@ -151,6 +157,7 @@ class TaskFinished(messages.Message):
         output: dict | None = None,
         steps: list | None = None,
         detail: str = None,
+        cached: bool = False,
         timestamp: str | None = None
     ):
         super().__init__(type=messages.MessageType.TASK_FINISHED, timestamp=timestamp)
@@ -161,6 +168,7 @@ class TaskFinished(messages.Message):
         self.output = output
         self.steps = steps
         self.detail = detail
+        self.cached = cached
 
     @property
     @override
@@ -172,7 +180,8 @@ class TaskFinished(messages.Message):
             "success": self.success,
             "output": self.output,
             "steps": self.steps,
-            "detail": self.detail
+            "detail": self.detail,
+            "cached": self.cached
         }
 
     @classmethod
@@ -186,5 +195,6 @@ class TaskFinished(messages.Message):
             output=data.get("output"),
             steps=data.get("steps"),
             detail=data.get("detail"),
+            cached=data.get("cached", False),
             timestamp=data.get("timestamp")
         )
@@ -0,0 +1,134 @@
+""""""
+from typing import Any, override
+import abc
+import dataclasses
+import sqlite3
+import threading
+import time
+
+from penflowexecutor import config
+from penflowexecutor.models import serializable
+
+
+@dataclasses.dataclass
+class Checkpoint:
+    """"""
+    digest: str  # Digest of the flow being executed
+    variables: dict[str, Any]
+    completed_tasks: set[str]  # When saved, only the tasks completed since the previous checkpoint
+
+
+class CheckpointStore(abc.ABC):
+    """"""
+
+    @abc.abstractmethod
+    def load(self, execution_id: str) -> Checkpoint | None:
+        """"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save(self, execution_id: str, checkpoint: Checkpoint):
+        """"""
+        # Variables replace the saved ones, completed tasks are added to them
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, execution_id: str):
+        """"""
+        raise NotImplementedError
+
+
+class NullCheckpointStore(CheckpointStore):
+    """"""
+
+    @override
+    def load(self, execution_id: str) -> Checkpoint | None:
+        return None
+
+    @override
+    def save(self, execution_id: str, checkpoint: Checkpoint):
+        pass
+
+    @override
+    def delete(self, execution_id: str):
+        pass
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @override
+    def load(self, execution_id: str) -> Checkpoint | None:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT digest, variables FROM checkpoints WHERE execution_id = ?",
+                (execution_id,)
+            ).fetchone()
+            completed_tasks = connection.execute(
+                "SELECT task_id FROM checkpoint_tasks WHERE execution_id = ?",
+                (execution_id,)
+            ).fetchall()
+        if row is None:
+            return None
+        return Checkpoint(
+            digest=row[0],
+            variables=serializable.loads(row[1]),
+            completed_tasks={task_id for task_id, in completed_tasks}
+        )
+
+    @override
+    def save(self, execution_id: str, checkpoint: Checkpoint):
+        variables = serializable.dumps(checkpoint.variables)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints (execution_id, digest, variables, updated_at) VALUES (?, ?, ?, ?)",
+                (execution_id, checkpoint.digest, variables, time.time())
+            )
+            # Completed tasks are appended, so that a checkpoint does not grow with the number of tasks already done
+            connection.executemany(
+                "INSERT OR IGNORE INTO checkpoint_tasks VALUES (?, ?)",
+                ((execution_id, task_id) for task_id in checkpoint.completed_tasks)
+            )
+            connection.commit()
+
+    @override
+    def delete(self, execution_id: str):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM checkpoints WHERE execution_id = ?", (execution_id,))
+            connection.execute("DELETE FROM checkpoint_tasks WHERE execution_id = ?", (execution_id,))
+            connection.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so that the store can be created before forking workers
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, check_same_thread=False)
+            # Workers of the same host share the database
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "execution_id TEXT PRIMARY KEY, digest TEXT, variables TEXT, updated_at REAL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint_tasks ("
+                "execution_id TEXT, task_id TEXT, PRIMARY KEY (execution_id, task_id))"
+            )
+        return self._connection
+
+
+DEFAULT_CHECKPOINT = config.get_checkpoint()
+""""""
+
+
+def make_store() -> CheckpointStore:
+    """"""
+    if DEFAULT_CHECKPOINT["path"]:
+        return SQLiteCheckpointStore(DEFAULT_CHECKPOINT["path"])
+    return NullCheckpointStore()
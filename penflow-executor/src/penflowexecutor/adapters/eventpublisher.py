@@ -1,14 +1,20 @@
 """"""
 from typing import Self, override
 import abc
+import asyncio
+import collections
 import json
+import threading
+import time
 
 from pika import exceptions as pika_exceptions
 from pika.adapters.blocking_connection import BlockingChannel, BlockingConnection
+from pika.adapters.select_connection import SelectConnection
+from pika.channel import Channel
 import pika
 
 from penflowexecutor import config
-from penflowexecutor.models import messages
+from penflowexecutor.models import messages, serializable
 
 
 class EventPublisher(abc.ABC):
@@ -36,9 +42,21 @@ class EventPublisher(abc.ABC):
         """"""
         raise NotImplementedError
 
+    async def aclose(self, execution_id: str):
+        """"""
+        self.close()
+
+    def shutdown(self):
+        """"""
+
+    def keepalive(self):
+        """"""
+
 
 DEFAULT_HOST = config.get_mq_host()
 """"""
+DEFAULT_HEARTBEAT = config.get_mq_heartbeat()
+""""""
 DEFAULT_EXCHANGE = config.get_mq_pub().get("exchange")
 """"""
 
@@ -59,36 +77,359 @@ class RabbitMQEventPublisher(EventPublisher):
         self._exchange = exchange
         self._connection: BlockingConnection | None = None
         self._channel: BlockingChannel | None = None
+        self._leases = 0
+        # Pika connections are not thread safe, concurrent executions share the same publisher
+        self._lock = threading.RLock()
+
+    @property
+    def leases(self) -> int:
+        """"""
+        return self._leases
 
     @override
     def connect(self):
+        # The connection is kept open for the whole worker lifetime, executions only lease it
+        with self._lock:
+            self._leases += 1
+            self._ensure_connection()
+
+    @override
+    def publish(self, message: messages.Message):
+        with self._lock:
+            if self._leases == 0:
+                raise ConnectionError
+
+            try:
+                if self._channel is None or self._channel.is_closed:
+                    self._reconnect()
+                self._basic_publish(message)
+            except (pika_exceptions.AMQPConnectionError, pika_exceptions.AMQPChannelError) as e:
+                # The broker may have dropped an idle connection, retry once on a new one
+                print("AMQPError, reconnecting", e)
+                self._reconnect()
+                self._basic_publish(message)
+
+    @override
+    def close(self):
+        with self._lock:
+            self._leases = max(self._leases - 1, 0)
+
+    @override
+    def shutdown(self):
+        with self._lock:
+            self._leases = 0
+            self._disconnect()
+
+    @override
+    def keepalive(self):
+        # Idle blocking connections only send heartbeats while processing data events
+        with self._lock:
+            if self._connection is not None and self._connection.is_open:
+                try:
+                    self._connection.process_data_events(time_limit=0)
+                except pika_exceptions.AMQPError as e:
+                    print("AMQPError", e)
+
+    def is_healthy(self) -> bool:
+        """"""
+        with self._lock:
+            if self._connection is None or self._connection.is_closed:
+                return False
+            if self._channel is None or self._channel.is_closed:
+                return False
+            try:
+                # Services heartbeats and surfaces a connection dropped by the broker
+                self._connection.process_data_events(time_limit=0)
+            except pika_exceptions.AMQPError:
+                return False
+            return True
+
+    def _ensure_connection(self):
+        if not self.is_healthy():
+            self._reconnect()
+
+    def _reconnect(self):
+        self._disconnect()
         try:
-            self._connection = pika.BlockingConnection(pika.ConnectionParameters(host=self._host, port=self._port))
+            self._connection = pika.BlockingConnection(pika.ConnectionParameters(host=self._host, port=self._port, **DEFAULT_HEARTBEAT))
             self._channel = self._connection.channel()
             self._channel.exchange_declare(exchange=self._exchange, exchange_type="fanout")
         except pika_exceptions.AMQPError as e:
             print("AMQPError", e)
             raise e
 
-    @override
-    def publish(self, message: messages.Message):
-        if self._channel is None or self._channel.is_closed:
-            raise ConnectionError
-
+    def _disconnect(self):
         try:
-            self._channel.basic_publish(
-                exchange=self._exchange,
-                routing_key="",
-                body=json.dumps(message.to_dict()),
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent
-                )
-            )
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
         except pika_exceptions.AMQPError as e:
             print("AMQPError", e)
-            raise e
+        finally:
+            self._connection = None
+            self._channel = None
+
+    def _basic_publish(self, message: messages.Message):
+        self._channel.basic_publish(
+            exchange=self._exchange,
+            routing_key="",
+            body=json.dumps(message.to_dict(), default=serializable.json_default),
+            properties=pika.BasicProperties(
+                delivery_mode=pika.DeliveryMode.Persistent
+            )
+        )
+
+
+DEFAULT_BATCHING = config.get_mq_pub_batching()
+""""""
+
+
+class BatchingRabbitMQEventPublisher(EventPublisher):
+    """"""
+
+    FLOW_EVENTS = (
+        messages.MessageType.FLOW_STARTED,
+        messages.MessageType.FLOW_FINISHED,
+        messages.MessageType.FLOW_FINISHED_PREMATURELY,
+    )
+    """"""
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST["host"],
+        port: int = DEFAULT_HOST["port"],
+        exchange: str = DEFAULT_EXCHANGE,
+        batch_size: int = DEFAULT_BATCHING["batch_size"],
+        flush_interval: float = DEFAULT_BATCHING["flush_interval"],
+        window: int = DEFAULT_BATCHING["window"],
+        publish_timeout: float = DEFAULT_BATCHING["publish_timeout"],
+        close_timeout: float = 30,
+    ):
+        self._host = host
+        self._port = port
+        self._exchange = exchange
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._window = window
+        self._publish_timeout = publish_timeout
+        self._close_timeout = close_timeout
+
+        # Events are published in the order they are buffered, unconfirmed ones are kept until the broker acks them.
+        # Each one is kept along with the execution it belongs to
+        self._buffer: collections.deque[tuple[str | None, str]] = collections.deque()
+        self._unconfirmed: collections.OrderedDict[int, tuple[str | None, str]] = collections.OrderedDict()
+        self._delivery_tag = 0
+        self._condition = threading.Condition()
+
+        # Events not confirmed yet and executions waiting for them to be, by execution
+        self._outstanding: collections.Counter[str | None] = collections.Counter()
+        self._waiters: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+        self._leases = 0
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._connection: SelectConnection | None = None
+        self._channel: Channel | None = None
+
+    @property
+    def pending(self) -> int:
+        """"""
+        with self._condition:
+            return len(self._buffer) + len(self._unconfirmed)
+
+    @override
+    def connect(self):
+        with self._condition:
+            self._leases += 1
+            # The I/O thread is started lazily so that the publisher can be created before forking
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    @override
+    def publish(self, message: messages.Message):
+        execution_id = getattr(message, "execution_id", None)
+        body = json.dumps(message.to_dict(), default=serializable.json_default)
+        with self._condition:
+            if self._leases == 0:
+                raise ConnectionError
+            full = len(self._buffer) >= self._window
+
+        # Apply back pressure once the buffer is full. Publishing blocks the event loop every execution runs on, so
+        # the wait is bounded and skipped while the broker is unreachable, the buffer outgrows the window meanwhile
+        if full:
+            self._request_flush()
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: len(self._buffer) < self._window or self._channel is None,
+                self._publish_timeout
+            ):
+                print(f"Publisher buffer is full, buffering {len(self._buffer) + 1} events")
+            self._buffer.append((execution_id, body))
+            self._outstanding[execution_id] += 1
+            flush = len(self._buffer) >= self._batch_size
+
+        if flush or message.type in self.FLOW_EVENTS:
+            self._request_flush()
 
     @override
     def close(self):
-        if self._connection and self._connection.is_open:
+        # Waits for the events of every execution, executions running on an event loop use aclose
+        self._request_flush()
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._buffer and not self._unconfirmed, self._close_timeout):
+                print(f"Closing publisher with {len(self._buffer) + len(self._unconfirmed)} unconfirmed events")
+            self._leases = max(self._leases - 1, 0)
+
+    @override
+    async def aclose(self, execution_id: str):
+        # Events of the execution must be confirmed before its command is acknowledged. The confirmation is awaited
+        # without blocking the loop, so that other executions keep running meanwhile
+        loop = asyncio.get_running_loop()
+        confirmed = loop.create_future()
+        with self._condition:
+            if self._outstanding[execution_id] > 0:
+                self._waiters.setdefault(execution_id, []).append((loop, confirmed))
+            else:
+                confirmed.set_result(None)
+        self._request_flush()
+
+        try:
+            await asyncio.wait_for(confirmed, self._close_timeout)
+        except asyncio.TimeoutError:
+            with self._condition:
+                print(f"Closing execution {execution_id} with {self._outstanding[execution_id]} unconfirmed events")
+                waiters = self._waiters.get(execution_id, [])
+                if (loop, confirmed) in waiters:
+                    waiters.remove((loop, confirmed))
+        finally:
+            with self._condition:
+                self._leases = max(self._leases - 1, 0)
+
+    @override
+    def shutdown(self):
+        with self._condition:
+            self._leases = 0
+            self._stopping = True
+        if self._connection is not None:
+            self._connection.ioloop.add_callback_threadsafe(self._close_connection)
+        if self._thread is not None:
+            self._thread.join(self._close_timeout)
+
+    def _request_flush(self):
+        connection = self._connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(self._flush)
+
+    def _run(self):
+        while not self._stopping:
+            self._connection = SelectConnection(
+                pika.ConnectionParameters(host=self._host, port=self._port, **DEFAULT_HEARTBEAT),
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed,
+            )
+            self._connection.ioloop.start()
+            self._connection = None
+            if not self._stopping:
+                time.sleep(1)
+
+    def _on_connection_open(self, connection: SelectConnection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection: SelectConnection, error: BaseException):
+        print("AMQPError", error)
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection: SelectConnection, reason: BaseException):
+        with self._condition:
+            self._channel = None
+            # Unconfirmed events are published again, in the same order, on the next connection
+            self._buffer.extendleft(reversed(self._unconfirmed.values()))
+            self._unconfirmed.clear()
+            self._condition.notify_all()
+        if not self._stopping:
+            print("AMQPError, reconnecting", reason)
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel: Channel):
+        channel.exchange_declare(
+            exchange=self._exchange,
+            exchange_type="fanout",
+            callback=lambda _: channel.confirm_delivery(
+                ack_nack_callback=self._on_delivery_confirmation,
+                callback=lambda _: self._on_channel_ready(channel)
+            )
+        )
+
+    def _on_channel_ready(self, channel: Channel):
+        with self._condition:
+            self._channel = channel
+            self._delivery_tag = 0
+        self._on_timer()
+
+    def _on_timer(self):
+        self._flush()
+        if self._connection is not None and self._channel is not None:
+            self._connection.ioloop.call_later(self._flush_interval, self._on_timer)
+
+    def _flush(self):
+        with self._condition:
+            # Keep at most `window` events in flight, the rest are published as confirmations arrive
+            while self._channel is not None and self._buffer and len(self._unconfirmed) < self._window:
+                execution_id, body = self._buffer.popleft()
+                self._delivery_tag += 1
+                self._unconfirmed[self._delivery_tag] = (execution_id, body)
+                self._channel.basic_publish(
+                    exchange=self._exchange,
+                    routing_key="",
+                    body=body,
+                    properties=pika.BasicProperties(
+                        delivery_mode=pika.DeliveryMode.Persistent
+                    )
+                )
+            self._condition.notify_all()
+
+    def _on_delivery_confirmation(self, frame: pika.frame.Method):
+        confirmation = frame.method
+        with self._condition:
+            if confirmation.multiple:
+                delivery_tags = [tag for tag in self._unconfirmed if tag <= confirmation.delivery_tag]
+            else:
+                delivery_tags = [confirmation.delivery_tag]
+            events = [self._unconfirmed.pop(tag) for tag in delivery_tags if tag in self._unconfirmed]
+            if isinstance(confirmation, pika.spec.Basic.Nack):
+                # Rejected events are published again before the buffered ones
+                self._buffer.extendleft(reversed(events))
+            else:
+                for execution_id, _ in events:
+                    self._confirm(execution_id)
+            self._condition.notify_all()
+        self._flush()
+
+    def _confirm(self, execution_id: str | None):
+        # Called with the condition held, wakes up the execution once all its events are confirmed
+        self._outstanding[execution_id] -= 1
+        if self._outstanding[execution_id] > 0:
+            return
+        del self._outstanding[execution_id]
+        for loop, confirmed in self._waiters.pop(execution_id, []):
+            loop.call_soon_threadsafe(self._resolve, confirmed)
+
+    @staticmethod
+    def _resolve(confirmed: asyncio.Future):
+        if not confirmed.done():
+            confirmed.set_result(None)
+
+    def _close_connection(self):
+        # Publish whatever is left before closing
+        self._flush()
+        if self._connection is not None and self._connection.is_open:
             self._connection.close()
+
+
+def make_publisher() -> EventPublisher:
+    """"""
+    if DEFAULT_BATCHING["enabled"]:
+        return BatchingRabbitMQEventPublisher()
+    return RabbitMQEventPublisher()
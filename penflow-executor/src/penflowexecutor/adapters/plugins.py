@@ -1,6 +1,8 @@
 """"""
 from typing import Self, Callable
 import importlib
+import json
+import os
 import pkgutil
 import sys
 
@@ -22,10 +24,35 @@ def load_plugins(path: str = DEFAULT_PLUGINS_PATH):
     sys.path.remove(path)
 
 
+def index_plugins(path: str = DEFAULT_PLUGINS_PATH) -> dict[str, tuple[str, str]]:
+    """"""
+    # Maps task names to the package implementing them from their metadata, without importing anything
+    index = {}
+    for directory, subdirectories, files in os.walk(path):
+        subdirectories[:] = [subdirectory for subdirectory in subdirectories if subdirectory != "__pycache__"]
+        if "metadata.json" not in files or "__init__.py" not in files:
+            continue
+        with open(os.path.join(directory, "metadata.json")) as f:
+            name = json.load(f)["name"]
+        index[name] = (path, os.path.relpath(directory, path).replace(os.sep, "."))
+    return index
+
+
+def import_plugin(path: str, module: str):
+    """"""
+    sys.path.append(path)
+    try:
+        importlib.import_module(module)
+    finally:
+        sys.path.remove(path)
+
+
 class PluginRegistry:
     """"""
     _instance: Self | None = None
     _plugins: dict[str, type] = {}
+    _index: dict[str, tuple[str, str]] = {}  # Plugins yet to be imported, by name
+    _failures: dict[str, exceptions.PenflowBootError] = {}  # Plugins that could not be imported, by name
 
     def __new__(cls):
         if cls._instance is None:
@@ -51,5 +78,32 @@ class PluginRegistry:
         """"""
         return self._plugins
 
+    def index(self, path: str = DEFAULT_PLUGINS_PATH):
+        """"""
+        self._index.update(index_plugins(path))
+
+    def preload(self):
+        """"""
+        for name in list(self._index):
+            try:
+                self.get(name)
+            except exceptions.PenflowBootError as e:
+                # Broken plugins only fail the flows using them
+                print(e.message)
+
     def get(self, name: str) -> type | None:
-        return self._plugins.get(name)
+        plugin = self._plugins.get(name)
+        if plugin is None and name in self._failures:
+            raise self._failures[name]
+        if plugin is None and name in self._index:
+            # Indexed plugins are imported on first use, a failed import is reported again on every later use
+            path, module = self._index.pop(name)
+            try:
+                import_plugin(path, module)
+            except Exception as e:
+                self._failures[name] = exceptions.PenflowBootError(
+                    f"Could not import plugin {name} from {module}, {type(e).__name__}: {e}"
+                )
+                raise self._failures[name]
+            plugin = self._plugins.get(name)
+        return plugin
@@ -0,0 +1,238 @@
+""""""
+from typing import Any, override
+import abc
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from penflowexecutor import config
+from penflowexecutor.models import serializable
+
+
+def make_key(task_name: str, version: str, properties: dict[str, Any]) -> str:
+    """"""
+    return hashlib.sha256(json.dumps(
+        {"task": task_name, "version": version, "properties": properties},
+        sort_keys=True,
+        default=serializable.json_default
+    ).encode()).hexdigest()
+
+
+class ResultCache(abc.ABC):
+    """"""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> dict[str, Any] | None:
+        """"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set(self, key: str, result: dict[str, Any], ttl: float):
+        """"""
+        raise NotImplementedError
+
+    async def aget(self, key: str) -> dict[str, Any] | None:
+        """"""
+        return self.get(key)
+
+    async def aset(self, key: str, result: dict[str, Any], ttl: float):
+        """"""
+        self.set(key, result, ttl)
+
+
+class MemoryResultCache(ResultCache):
+    """"""
+
+    def __init__(self, size: int):
+        self._size = size
+        # Results are stored serialised, so that callers never share (and mutate) the cached objects
+        self._entries: collections.OrderedDict[str, tuple[float, str]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @override
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return serializable.loads(payload)
+
+    @override
+    def set(self, key: str, result: dict[str, Any], ttl: float):
+        self.set_raw(key, serializable.dumps(result), time.time() + ttl)
+
+    def set_raw(self, key: str, payload: str, expires_at: float):
+        """"""
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+
+class DiskResultCache(ResultCache):
+    """"""
+
+    def __init__(self, path: str, size: int, prune_interval: float):
+        self._path = path
+        self._size = size
+        self._prune_interval = prune_interval
+        self._pruned_at = time.monotonic()
+        self._pruning = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @override
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self.get_raw(key)
+        return serializable.loads(entry[1]) if entry is not None else None
+
+    def get_raw(self, key: str) -> tuple[float, str] | None:
+        """"""
+        try:
+            with open(self._file(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expiresAt"] <= time.time():
+            self._remove(self._file(key))
+            return None
+        return entry["expiresAt"], entry["payload"]
+
+    @override
+    def set(self, key: str, result: dict[str, Any], ttl: float):
+        self.set_raw(key, serializable.dumps(result), time.time() + ttl)
+
+    def set_raw(self, key: str, payload: str, expires_at: float):
+        """"""
+        entry = json.dumps({"expiresAt": expires_at, "payload": payload})
+        # Entries are replaced atomically, concurrent workers may share the same directory
+        fd, tmp_path = tempfile.mkstemp(dir=self._path)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(entry)
+            # The modification time holds the expiration, so that entries can be pruned without reading them
+            os.utime(tmp_path, (expires_at, expires_at))
+            os.replace(tmp_path, self._file(key))
+        except OSError as e:
+            print("Could not write cache entry", e)
+            self._remove(tmp_path)
+
+        if time.monotonic() - self._pruned_at >= self._prune_interval and self._pruning.acquire(blocking=False):
+            self._pruned_at = time.monotonic()
+            # The directory is scanned in the background, setting an entry does not wait for it
+            threading.Thread(target=self._prune, daemon=True).start()
+
+    def _prune(self):
+        try:
+            self._prune_entries()
+        finally:
+            self._pruning.release()
+
+    def _prune_entries(self):
+        entries = []
+        try:
+            with os.scandir(self._path) as it:
+                for dir_entry in it:
+                    # Temporary files are being written by some worker, only complete entries are pruned
+                    if not dir_entry.name.endswith(".json"):
+                        continue
+                    try:
+                        entries.append((dir_entry.stat().st_mtime, dir_entry.path))
+                    except OSError:
+                        pass  # Removed by another worker meanwhile
+        except OSError as e:
+            print("Could not prune cache entries", e)
+            return
+
+        # Expired entries go first, then the ones closest to expiring until the cache fits its size
+        entries.sort()
+        now = time.time()
+        excess = len(entries) - self._size
+        for i, (expires_at, path) in enumerate(entries):
+            if expires_at > now and i >= excess:
+                break
+            self._remove(path)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._path, f"{key}.json")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class TieredResultCache(ResultCache):
+    """"""
+
+    def __init__(self, memory: MemoryResultCache, disk: DiskResultCache | None = None):
+        self._memory = memory
+        self._disk = disk
+
+    @override
+    def get(self, key: str) -> dict[str, Any] | None:
+        result = self._memory.get(key)
+        if result is not None or self._disk is None:
+            return result
+        return self._get_from_disk(key)
+
+    @override
+    def set(self, key: str, result: dict[str, Any], ttl: float):
+        # Results are serialised once for both tiers
+        payload = serializable.dumps(result)
+        expires_at = time.time() + ttl
+        self._memory.set_raw(key, payload, expires_at)
+        if self._disk is not None:
+            self._disk.set_raw(key, payload, expires_at)
+
+    @override
+    async def aget(self, key: str) -> dict[str, Any] | None:
+        result = self._memory.get(key)
+        if result is not None or self._disk is None:
+            return result
+        # The disk tier reads and parses files, which would stall every other execution on the loop
+        return await asyncio.to_thread(self._get_from_disk, key)
+
+    @override
+    async def aset(self, key: str, result: dict[str, Any], ttl: float):
+        if self._disk is None:
+            self.set(key, result, ttl)
+        else:
+            await asyncio.to_thread(self.set, key, result, ttl)
+
+    def _get_from_disk(self, key: str) -> dict[str, Any] | None:
+        entry = self._disk.get_raw(key)
+        if entry is None:
+            return None
+        # Promote to memory keeping the original expiration
+        self._memory.set_raw(key, entry[1], entry[0])
+        return serializable.loads(entry[1])
+
+
+DEFAULT_RESULT_CACHE = config.get_result_cache()
+""""""
+
+
+def make_cache() -> ResultCache:
+    """"""
+    path = DEFAULT_RESULT_CACHE["path"]
+    return TieredResultCache(
+        memory=MemoryResultCache(DEFAULT_RESULT_CACHE["size"]),
+        disk=DiskResultCache(
+            path,
+            size=DEFAULT_RESULT_CACHE["disk_size"],
+            prune_interval=DEFAULT_RESULT_CACHE["prune_interval"]
+        ) if path else None
+    )
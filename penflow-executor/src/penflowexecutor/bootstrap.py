@@ -1,12 +1,12 @@
 """"""
-from penflowexecutor import container
+from penflowexecutor import config, container
 from penflowexecutor.adapters import eventpublisher, plugins
 from penflowexecutor.services import executor as flow_executor
 
 
 def bootstrap(
     import_plugins: bool = True,
-    publisher: eventpublisher.EventPublisher = eventpublisher.RabbitMQEventPublisher(),
+    publisher: eventpublisher.EventPublisher = eventpublisher.make_publisher(),
     executor: flow_executor.FlowExecutor = None,
 ) -> container.Container:
     """"""
@@ -14,7 +14,10 @@ def bootstrap(
         executor = flow_executor.FlowExecutor(publisher=publisher)
 
     if import_plugins:
-        plugins.load_plugins()
+        if config.get_plugins_lazy():
+            plugins.PluginRegistry().index()
+        else:
+            plugins.load_plugins()
 
     return container.DefaultContainer(
         flow_executor=executor
@@ -9,11 +9,69 @@ def get_plugins_path() -> str:
     return config.get("PLUGINS", "")
 
 
+def get_plugins_lazy() -> bool:
+    """"""
+    return config.get("PLUGINS_LAZY", "true").lower() == "true"
+
+
+def get_plugins_preload() -> bool:
+    """"""
+    return config.get("PLUGINS_PRELOAD", "true").lower() == "true"
+
+
+def get_worker_recycling() -> dict[str, int | float]:
+    """"""
+    return {
+        "max_executions": int(config.get("WORKER_MAX_EXECUTIONS", 0)),
+        "max_rss": int(config.get("WORKER_MAX_RSS_MB", 0)) * 1024 * 1024,
+        "restart_backoff": float(config.get("WORKER_RESTART_BACKOFF", 1)),
+        "restart_backoff_max": float(config.get("WORKER_RESTART_BACKOFF_MAX", 60))
+    }
+
+
+def get_autoscaling() -> dict[str, int | float]:
+    """"""
+    return {
+        "max_workers": int(config.get("PROCESSES_MAX", 0)),
+        "interval": float(config.get("AUTOSCALING_INTERVAL", 5)),
+        "up_after": int(config.get("AUTOSCALING_UP_AFTER", 2)),
+        "down_after": int(config.get("AUTOSCALING_DOWN_AFTER", 12))
+    }
+
+
 def get_num_workers() -> int:
     """"""
     return int(config.get("PROCESSES", 2))
 
 
+def get_concurrency() -> int:
+    """"""
+    return int(config.get("CONCURRENCY", 1))
+
+
+def get_plan_cache_size() -> int:
+    """"""
+    return int(config.get("PLAN_CACHE_SIZE", 128))
+
+
+def get_result_cache() -> dict[str, str | int | float]:
+    """"""
+    return {
+        "size": int(config.get("RESULT_CACHE_SIZE", 256)),
+        "path": config.get("RESULT_CACHE_PATH", ""),
+        "disk_size": int(config.get("RESULT_CACHE_DISK_SIZE", 4096)),
+        "prune_interval": float(config.get("RESULT_CACHE_PRUNE_INTERVAL", 60))
+    }
+
+
+def get_checkpoint() -> dict[str, str | float]:
+    """"""
+    return {
+        "path": config.get("CHECKPOINT_PATH", ""),
+        "interval": float(config.get("CHECKPOINT_INTERVAL", 5))
+    }
+
+
 def get_mq_host() -> dict[str, str | int]:
     """"""
     return {
@@ -22,6 +80,14 @@ def get_mq_host() -> dict[str, str | int]:
     }
 
 
+def get_mq_heartbeat() -> dict[str, int]:
+    """"""
+    return {
+        "heartbeat": int(config.get("RABBITMQ_HEARTBEAT", 60)),
+        "blocked_connection_timeout": int(config.get("RABBITMQ_BLOCKED_CONNECTION_TIMEOUT", 300))
+    }
+
+
 def get_mq_pub() -> dict[str, str]:
     """"""
     return {
@@ -30,6 +96,17 @@ def get_mq_pub() -> dict[str, str]:
     }
 
 
+def get_mq_pub_batching() -> dict[str, bool | int | float]:
+    """"""
+    return {
+        "enabled": config.get("RABBITMQ_PUB_BATCHING", "false").lower() == "true",
+        "batch_size": int(config.get("RABBITMQ_PUB_BATCH_SIZE", 100)),
+        "flush_interval": float(config.get("RABBITMQ_PUB_FLUSH_INTERVAL", 0.05)),
+        "window": int(config.get("RABBITMQ_PUB_CONFIRM_WINDOW", 1000)),
+        "publish_timeout": float(config.get("RABBITMQ_PUB_TIMEOUT", 1)),
+    }
+
+
 def get_mq_sub() -> dict[str, str]:
     """"""
     return {
@@ -1,83 +1,414 @@
 """"""
 from typing import cast
+import asyncio
+import concurrent.futures
+import dataclasses
+import functools
+import gc
 import json
+import math
 import multiprocessing
+import multiprocessing.connection
 import os
+import resource
 import signal
+import threading
+import time
 
+from pika import exceptions as pika_exceptions
 from pika.adapters.blocking_connection import BlockingChannel
 from pika.spec import Basic, BasicProperties
 import pika
 
 from penflowexecutor import config, bootstrap, exceptions
+from penflowexecutor.adapters import plugins
 from penflowexecutor.models import messages
 from penflowexecutor.services import handlers
 
 
 DEFAULT_HOST = config.get_mq_host()
 """"""
+DEFAULT_HEARTBEAT = config.get_mq_heartbeat()
+""""""
 DEFAULT_QUEUE = config.get_mq_sub().get("queue")
 """"""
 
 
-def main():
+DEFAULT_CONCURRENCY = config.get_concurrency()
+""""""
+RECONNECT_DELAY = 5
+""""""
+DEFAULT_RECYCLING = config.get_worker_recycling()
+""""""
+
+
+def rss() -> int:
+    """"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak rather than current resident size where procfs is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_executions: int = DEFAULT_RECYCLING["max_executions"],
+    max_rss: int = DEFAULT_RECYCLING["max_rss"],
+    status: multiprocessing.connection.Connection | None = None
+):
     """"""
     app_container = bootstrap.bootstrap()
+    publisher = app_container.flow_executor.eventpublisher
+
+    # Flows run concurrently on an event loop owned by a separate thread, so that this one keeps consuming and
+    # servicing heartbeats however long an execution takes
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+
+    def keepalive():
+        """"""
+        publisher.keepalive()
+        loop.call_later(DEFAULT_HEARTBEAT["heartbeat"] / 2, keepalive)
+
+    loop.call_soon_threadsafe(keepalive)
+
+    # Executions running in this worker, a redelivered command waits for them instead of running them again
+    running: dict[str, concurrent.futures.Future] = {}
+    running_lock = threading.Lock()
+
+    # Once recycling is due the worker stops taking executions, it exits when the running ones are acknowledged
+    executions = 0
+    draining = False
+    consumer_tag = None
+    unacknowledged = 0  # Deliveries of executions yet to be acknowledged, only used from the connection thread
+
+    def ack(ch: BlockingChannel, delivery_tag: int):
+        """"""
+        if ch.is_closed:
+            # The broker requeues the unacknowledged messages of closed channels
+            print(f"{os.getpid()}: Channel closed, message will be redelivered")
+            return
+        ch.basic_ack(delivery_tag=delivery_tag)
+        print(f"{os.getpid()}: Ack")
+
+    def on_flow_done(ch: BlockingChannel, delivery_tag: int, future: concurrent.futures.Future):
+        """"""
+        try:
+            future.result()
+        except exceptions.PenflowRuntimeError as e:
+            print(f"{os.getpid()}:{e.origin} - Failed due to {e.message}")
+        except exceptions.PenflowError as e:
+            print(f"{os.getpid()} - Failed due to {e.message}")
+        except Exception as e:
+            print(f"{os.getpid()} - Failed due to {e}")
+        finally:
+            # Channels can only be used from the connection thread
+            try:
+                ch.connection.add_callback_threadsafe(functools.partial(finish, ch, delivery_tag))
+            except pika_exceptions.ConnectionWrongStateError:
+                print(f"{os.getpid()}: Connection closed, message will be redelivered")
+
+    def finish(ch: BlockingChannel, delivery_tag: int):
+        """"""
+        nonlocal executions, unacknowledged
+        ack(ch, delivery_tag)
+        unacknowledged -= 1
+        executions += 1
+        if not draining and (0 < max_executions <= executions or 0 < max_rss <= rss()):
+            start_draining(f"Recycling after {executions} executions using {rss() >> 20}MiB")
+
+        stop_if_drained(ch)
+
+    def drain(*_):
+        """"""
+        start_draining(f"Retiring after {executions} executions")
+
+    def start_draining(reason: str):
+        """"""
+        nonlocal draining
+        if draining:
+            return
+        print(f"{os.getpid()}: {reason}")
+        draining = True
+        # The supervisor no longer counts this worker as consuming and replaces it without waiting for it to exit
+        if status is not None:
+            try:
+                status.send(reason)
+            except OSError:
+                pass
+
+    def stop_if_drained(ch: BlockingChannel):
+        """"""
+        nonlocal consumer_tag
+        if draining and consumer_tag is not None and ch.is_open:
+            # No more messages are delivered to a draining worker, the ones not yet dispatched are requeued
+            ch.basic_cancel(consumer_tag)
+            consumer_tag = None
+
+    def on_execution_done(execution_id: str, _: concurrent.futures.Future):
+        """"""
+        with running_lock:
+            running.pop(execution_id, None)
 
     def callback(ch: BlockingChannel, method: Basic.Deliver, properties: BasicProperties, body: bytes):
         """"""
+        nonlocal unacknowledged
+        if draining:
+            # Hand the message over to another worker
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+
         try:
             message = messages.message_maker(json.loads(body.decode()))
 
             match message.type:
                 case messages.MessageType.EXECUTE:
-                    handlers.execute_flow(cast(messages.Execute, message), app_container.flow_executor)
+                    cmd = cast(messages.Execute, message)
+                    with running_lock:
+                        future = running.get(cmd.execution_id)
+                        if future is None:
+                            future = asyncio.run_coroutine_threadsafe(
+                                handlers.execute_flow(cmd, app_container.flow_executor),
+                                loop
+                            )
+                            running[cmd.execution_id] = future
+                            future.add_done_callback(functools.partial(on_execution_done, cmd.execution_id))
+                        else:
+                            print(f"{os.getpid()}:{cmd.execution_id} - Redelivered while running")
+                    unacknowledged += 1
+                    future.add_done_callback(functools.partial(on_flow_done, ch, method.delivery_tag))
+                    return
                 case _: raise exceptions.InvalidMessageError(message_type=message.type)
-        except exceptions.PenflowRuntimeError as e:
-            print(f"{os.getpid()}:{e.origin} - Failed due to {e.message}")
         except exceptions.PenflowError as e:
             print(f"{os.getpid()} - Failed due to {e.message}")
+        ack(ch, method.delivery_tag)
+
+    def consume():
+        """"""
+        nonlocal consumer_tag, unacknowledged
+        # Deliveries of a lost connection are redelivered, they are no longer acknowledged
+        unacknowledged = 0
+        connection = pika.BlockingConnection(pika.ConnectionParameters(**DEFAULT_HOST, **DEFAULT_HEARTBEAT))
+        try:
+            channel = connection.channel()
+            channel.queue_declare(queue=DEFAULT_QUEUE, durable=True)
+            # Up to `concurrency` unacknowledged executions are delivered to this worker at once
+            channel.basic_qos(prefetch_count=concurrency)
+            consumer_tag = channel.basic_consume(queue=DEFAULT_QUEUE, on_message_callback=callback)
+
+            # Workers retired by the supervisor are drained from the connection thread
+            def on_timer():
+                stop_if_drained(channel)
+                connection.call_later(1, on_timer)
+
+            connection.call_later(1, on_timer)
+
+            print("[*] Waiting for messages. To exit press CTRL+C")
+            channel.start_consuming()
+
+            # Consuming stops as soon as the worker drains, its connection is kept to acknowledge the running executions
+            while draining and unacknowledged > 0 and channel.is_open:
+                connection.process_data_events(time_limit=1)
         finally:
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            print(f"{os.getpid()}: Ack")
+            if connection.is_open:
+                connection.close()
 
-    connection = pika.BlockingConnection(pika.ConnectionParameters(**DEFAULT_HOST))
-    channel = connection.channel()
-    channel.queue_declare(queue=DEFAULT_QUEUE, durable=True)
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue=DEFAULT_QUEUE, on_message_callback=callback)
+    signal.signal(signal.SIGUSR1, drain)
 
     try:
-        print("[*] Waiting for messages. To exit press CTRL+C")
-        channel.start_consuming()
+        while True:
+            try:
+                consume()
+                break
+            except (pika_exceptions.AMQPConnectionError, pika_exceptions.ChannelClosedByBroker) as e:
+                if draining:
+                    # Unacknowledged executions are redelivered to other workers
+                    break
+                # Running executions carry on, their commands are acknowledged or redelivered once they finish
+                print(f"{os.getpid()} - Connection lost, reconnecting", e)
+                time.sleep(RECONNECT_DELAY)
     except KeyboardInterrupt:
         print("Exiting")
     finally:
-        channel.stop_consuming()
-        connection.close()
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        publisher.shutdown()
 
 
 DEFAULT_WORKERS = config.get_num_workers()
 """"""
+DEFAULT_PRELOAD = config.get_plugins_preload()
+""""""
+DEFAULT_AUTOSCALING = config.get_autoscaling()
+""""""
+
+
+def preload():
+    """"""
+    # Plugins are imported once in the parent, forked workers share them copy-on-write
+    if config.get_plugins_lazy():
+        registry = plugins.PluginRegistry()
+        registry.index()
+        registry.preload()
+    else:
+        plugins.load_plugins()
+    # Keep the garbage collector of every worker from touching, and so copying, the preloaded objects
+    gc.freeze()
+
+
+def queue_depth(queue: str = DEFAULT_QUEUE) -> tuple[int, int]:
+    """"""
+    # Passive declarations only inspect the queue, the connection is not kept so that workers do not inherit it
+    connection = pika.BlockingConnection(pika.ConnectionParameters(**DEFAULT_HOST))
+    try:
+        frame = connection.channel().queue_declare(queue=queue, passive=True)
+        return frame.method.message_count, frame.method.consumer_count
+    finally:
+        if connection.is_open:
+            connection.close()
+
+
+@dataclasses.dataclass
+class Worker:
+    """"""
+    process: multiprocessing.Process | None = None  # None while a restart is delayed
+    status: multiprocessing.connection.Connection | None = None  # Receives the notice of the worker starting to drain
+    started_at: float = 0
+    failures: int = 0  # Consecutive exits without draining
+    restart_at: float = 0
+
+    def is_draining(self) -> bool:
+        """"""
+        if self.status is None or not self.status.poll():
+            return False
+        try:
+            self.status.recv()
+            return True
+        except EOFError:
+            # Exited without draining
+            self.status.close()
+            self.status = None
+            return False
 
 
-def spawn(workers: int = DEFAULT_WORKERS):
+def spawn(
+    workers: int = DEFAULT_WORKERS,
+    preload_plugins: bool = DEFAULT_PRELOAD,
+    max_workers: int = DEFAULT_AUTOSCALING["max_workers"]
+):
     """"""
-    default_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if preload_plugins:
+        preload()
+    mp_context = multiprocessing.get_context("fork" if preload_plugins else None)
 
-    processes = []
-    for _ in range(workers):
-        p = multiprocessing.Process(target=main)
-        processes.append(p)
+    def start(worker: Worker):
+        """"""
+        receiver, sender = mp_context.Pipe(duplex=False)
+        default_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        p = mp_context.Process(target=main, kwargs={"status": sender})
         p.start()
+        signal.signal(signal.SIGINT, default_sigint_handler)
+        sender.close()
+        worker.process, worker.status, worker.started_at = p, receiver, time.monotonic()
 
-    signal.signal(signal.SIGINT, default_sigint_handler)
+    def release(worker: Worker) -> multiprocessing.Process:
+        """"""
+        if worker.status is not None:
+            worker.status.close()
+        p, worker.process, worker.status = worker.process, None, None
+        return p
+
+    # Between `workers` and `max_workers` processes are kept depending on the queue depth
+    autoscaling = max_workers > workers
+    interval = DEFAULT_AUTOSCALING["interval"]
+    backlog_polls = 0
+    idle_polls = 0
+    next_poll = time.monotonic()
+
+    pool = [Worker() for _ in range(workers)]
+    for worker in pool:
+        start(worker)
+    # Workers no longer consuming, already replaced or retired, they exit once their executions are acknowledged
+    draining: list[multiprocessing.Process] = []
 
     try:
-        for p in processes:
-            p.join()
+        while True:
+            deadlines = [worker.restart_at for worker in pool if worker.process is None]
+            if autoscaling:
+                deadlines.append(next_poll)
+            timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            multiprocessing.connection.wait(
+                [worker.process.sentinel for worker in pool if worker.process is not None]
+                + [worker.status for worker in pool if worker.status is not None]
+                + [p.sentinel for p in draining],
+                timeout
+            )
+
+            draining = [p for p in draining if p.is_alive()]
+            for worker in list(pool):
+                if worker.process is None:
+                    if worker.restart_at <= time.monotonic():
+                        start(worker)
+                    continue
+
+                if worker.is_draining():
+                    # Recycled workers are replaced as soon as they stop consuming, not once their executions are done
+                    print(f"Worker {worker.process.pid} recycling, starting its replacement")
+                    draining.append(release(worker))
+                    worker.failures = 0
+                    start(worker)
+                elif not worker.process.is_alive():
+                    # Workers crashing over and over, e.g. on boot, are restarted less and less often. A worker that ran
+                    # for longer than the longest delay is deemed healthy, so its crash count starts over
+                    uptime = time.monotonic() - worker.started_at
+                    worker.failures = worker.failures + 1 if uptime < DEFAULT_RECYCLING["restart_backoff_max"] else 1
+                    delay = min(
+                        DEFAULT_RECYCLING["restart_backoff"] * 2 ** (worker.failures - 1),
+                        DEFAULT_RECYCLING["restart_backoff_max"]
+                    )
+                    p = release(worker)
+                    print(f"Worker {p.pid} exited with code {p.exitcode}, restarting in {delay:g}s")
+                    worker.restart_at = time.monotonic() + delay
+
+            if not autoscaling or time.monotonic() < next_poll:
+                continue
+            next_poll = time.monotonic() + interval
+
+            try:
+                backlog, consumers = queue_depth()
+            except pika_exceptions.AMQPError as e:
+                print("Could not poll queue depth", e)
+                continue
+
+            # Scale only on a sustained backlog or idleness, so that short bursts do not make the pool flap. Draining
+            # workers are not part of the pool, they have cancelled their consumer and are not counted by the broker
+            backlog_polls = backlog_polls + 1 if backlog > 0 else 0
+            idle_polls = idle_polls + 1 if backlog == 0 else 0
+
+            if backlog_polls >= DEFAULT_AUTOSCALING["up_after"] and len(pool) < max_workers:
+                # Wait until the workers already started consume, otherwise the backlog is counted twice. Slots waiting
+                # to restart a crashed worker have no consumer
+                if consumers < sum(worker.process is not None for worker in pool):
+                    continue
+                added = min(math.ceil(backlog / DEFAULT_CONCURRENCY), max_workers - len(pool))
+                print(f"Backlog of {backlog} executions, starting {added} workers")
+                for _ in range(added):
+                    pool.append(Worker())
+                    start(pool[-1])
+                backlog_polls = 0
+            elif idle_polls >= DEFAULT_AUTOSCALING["down_after"] and len(pool) > workers:
+                # The newest worker leaves the pool right away, it drains its running executions before exiting
+                worker = pool.pop()
+                if worker.process is not None:
+                    print(f"Queue idle, retiring worker {worker.process.pid}")
+                    os.kill(worker.process.pid, signal.SIGUSR1)
+                    draining.append(release(worker))
+                idle_polls = 0
     except KeyboardInterrupt:
-        for p in processes:
+        for p in [worker.process for worker in pool if worker.process is not None] + draining:
             p.terminate()
             p.join()
 
@@ -1 +1,2 @@
 from penflowexecutor.models.flow import Flow, FlowTask, TaskType
+from penflowexecutor.models.template import TaskTemplate
@@ -22,6 +22,7 @@ class FlowTask(serializable.ISerializable):
     properties: dict[str, Any]
     outputs: dict[str, str]
     subtasks: dict[str, list[Self]] | None
+    source: Self | None = dataclasses.field(default=None, compare=False, repr=False)  # Task it was instantiated from
 
     @classmethod
     @override
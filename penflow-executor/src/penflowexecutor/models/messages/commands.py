@@ -2,7 +2,7 @@
 from typing import Any, Self, override
 import dataclasses
 
-from penflowexecutor import exceptions, models
+from penflowexecutor import exceptions
 from penflowexecutor.models import messages
 
 
@@ -10,13 +10,13 @@ from penflowexecutor.models import messages
 class Execute(messages.Message):
     """"""
     execution_id: str  # Required
-    flow: models.Flow  # Required
+    flow: dict[str, Any]  # Required, compiled by the executor
     arguments: dict[str, Any]  # Optional
 
     def __init__(
         self,
         execution_id: str,
-        flow: models.Flow,
+        flow: dict[str, Any],
         arguments: dict[str, Any] | None = None,
         timestamp: str | None = None,
     ):
@@ -30,7 +30,7 @@ class Execute(messages.Message):
     def data(self) -> dict[str, Any]:
         return {
             "execution_id": self.execution_id,
-            "flow": self.flow.to_dict(),
+            "flow": self.flow,
             "arguments": self.arguments
         }
 
@@ -52,7 +52,7 @@ class Execute(messages.Message):
         else:
             return cls(
                 execution_id=data["execution_id"],
-                flow=models.Flow.from_dict(data["flow"]),
+                flow=data["flow"],
                 arguments=data.get("arguments"),
                 timestamp=data.get("timestamp"),
             )
@@ -1,4 +1,7 @@
 from penflowexecutor.models.plugins.task import Task
 from penflowexecutor.models.plugins.runnable_task import RunnableTask
-from penflowexecutor.models.plugins.behavioral_task import BehavioralTask
+from penflowexecutor.models.plugins.async_runnable_task import AsyncRunnableTask
+from penflowexecutor.models.plugins.channel import Channel
+from penflowexecutor.models.plugins.streaming_task import StreamingTask
+from penflowexecutor.models.plugins.behavioral_task import BehavioralTask, Iteration
 
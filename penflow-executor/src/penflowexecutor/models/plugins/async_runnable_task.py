@@ -0,0 +1,16 @@
+""""""
+from typing import Any, override
+import abc
+
+from penflowexecutor.models.plugins import runnable_task
+from penflowexecutor.services import context
+
+
+class AsyncRunnableTask(runnable_task.RunnableTask):
+    """"""
+
+    @abc.abstractmethod
+    @override
+    async def run(self, ctx: context.Context) -> dict[str, Any]:
+        """"""
+        raise NotImplementedError
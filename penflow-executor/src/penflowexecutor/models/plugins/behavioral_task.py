@@ -1,15 +1,37 @@
 """"""
+from typing import Any, AsyncIterator, Iterable, Iterator
 import abc
+import dataclasses
 
 from penflowexecutor import models
 from penflowexecutor.models import plugins as plugins_model
 from penflowexecutor.services import context
 
 
+@dataclasses.dataclass
+class Iteration:
+    """"""
+    variables: dict[str, Any]
+    tasks: list[models.FlowTask]
+
+
 class BehavioralTask(plugins_model.Task):
     """"""
+    parallelism: int = 1
+
+    @classmethod
+    def isolates_subtasks(cls, properties: dict[str, Any]) -> bool:
+        """"""
+        # Whether subtasks run in scopes of their own, so that the variables they declare are gone once the task is done
+        return False
 
     @abc.abstractmethod
-    def resolve(self, ctx: context) -> list[models.FlowTask]:
+    def resolve(self, ctx: context) -> Iterable[models.FlowTask]:
         """"""
         raise NotImplementedError
+
+    def iterations(self, ctx: context.Context) -> Iterator[Iteration] | AsyncIterator[Iteration]:
+        """"""
+        # Resolved tasks are consumed one at a time, so generators are only advanced when the previous task is done
+        for task in self.resolve(ctx):
+            yield Iteration(variables={}, tasks=[task])
@@ -0,0 +1,49 @@
+""""""
+from typing import Any, AsyncIterator
+import asyncio
+
+
+class Channel:
+    """"""
+
+    def __init__(self):
+        self._items: list[Any] = []
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    @property
+    def items(self) -> list[Any]:
+        """"""
+        return self._items
+
+    @property
+    def closed(self) -> bool:
+        """"""
+        return self._closed
+
+    def put(self, item: Any):
+        """"""
+        self._items.append(item)
+        self._notify()
+
+    def close(self):
+        """"""
+        self._closed = True
+        self._notify()
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        # Every consumer iterates over all the items, including those put before it started
+        index = 0
+        while True:
+            if index < len(self._items):
+                yield self._items[index]
+                index += 1
+            elif self._closed:
+                return
+            else:
+                await self._changed.wait()
+
+    def _notify(self):
+        # Waiters hold the current event, a new one is used for the following change
+        self._changed.set()
+        self._changed = asyncio.Event()
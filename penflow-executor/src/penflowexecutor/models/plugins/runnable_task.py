@@ -8,6 +8,9 @@ from penflowexecutor.services import context
 
 class RunnableTask(task.Task):
     """"""
+    version: str = "1"
+    cache_ttl: float = 0  # Seconds results are reused for the same properties, disabled by default
+
     def __init__(self):
         self._steps: list[str] = []
 
@@ -0,0 +1,23 @@
+""""""
+from typing import Any, override
+import abc
+import collections
+
+from penflowexecutor.models.plugins import async_runnable_task, channel
+from penflowexecutor.services import context
+
+
+class StreamingTask(async_runnable_task.AsyncRunnableTask):
+    """"""
+
+    @abc.abstractmethod
+    async def stream(self, ctx: context.Context, channels: dict[str, channel.Channel]):
+        """"""
+        raise NotImplementedError
+
+    @override
+    async def run(self, ctx: context.Context) -> dict[str, Any]:
+        # Outputs are collected once the task is done when nothing consumes them as they are produced
+        channels = collections.defaultdict(channel.Channel)
+        await self.stream(ctx, channels)
+        return {output_name: output_channel.items for output_name, output_channel in channels.items()}
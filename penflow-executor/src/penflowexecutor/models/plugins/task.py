@@ -5,3 +5,4 @@ import abc
 class Task(abc.ABC):
     """"""
     properties: dict[str, Any]
+    streamed_properties: tuple[str, ...] = ()  # Properties that can be bound to channels while they are being filled
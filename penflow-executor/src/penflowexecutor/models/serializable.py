@@ -1,10 +1,18 @@
 """"""
 from typing import Any, Self
 import abc
+import json
 
 
 class ISerializable(abc.ABC):
     """"""
+    __slots__ = ()
+
+    _types: dict[str, type["ISerializable"]] = {}  # By type name, so that stored values can be rehydrated
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ISerializable._types[type_name(cls)] = cls
 
     @classmethod
     @abc.abstractmethod
@@ -16,3 +24,42 @@ class ISerializable(abc.ABC):
     def to_dict(self, skip: list[str] | None = None) -> dict:
         """"""
         raise NotImplementedError
+
+
+TYPE_KEY = "__type__"
+""""""
+
+
+def type_name(cls: type) -> str:
+    """"""
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def json_default(value: Any) -> Any:
+    """"""
+    # Serializable values are kept as they are until they are published or stored, only then they become dicts
+    if isinstance(value, ISerializable):
+        return value.to_dict()
+    return str(value)
+
+
+def dumps(value: Any) -> str:
+    """"""
+    # Stored values are tagged with their type, so that loading them returns the same types a fresh run does
+    def default(value: Any) -> Any:
+        if isinstance(value, ISerializable):
+            return {TYPE_KEY: type_name(type(value)), **value.to_dict()}
+        return str(value)
+
+    return json.dumps(value, default=default)
+
+
+def loads(payload: str) -> Any:
+    """"""
+    def object_hook(data: dict[str, Any]) -> Any:
+        if TYPE_KEY not in data:
+            return data
+        cls = ISerializable._types.get(data.pop(TYPE_KEY))
+        return cls.from_dict(data) if cls is not None else data
+
+    return json.loads(payload, object_hook=object_hook)
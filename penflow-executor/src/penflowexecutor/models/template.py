@@ -0,0 +1,61 @@
+""""""
+from typing import Any, Self
+import dataclasses
+
+from penflowexecutor.models import flow
+
+
+@dataclasses.dataclass(frozen=True)
+class TaskTemplate:
+    """"""
+    task: flow.FlowTask
+    slots: tuple[tuple[str, str], ...]  # (property name, variable name) pairs bindable on instantiation
+    subtasks: tuple[tuple[str, tuple[Self, ...]], ...] | None
+
+    @classmethod
+    def compile(cls, tasks: list[flow.FlowTask], shadowed: frozenset[str] = frozenset()) -> tuple[Self, ...]:
+        """"""
+        templates = []
+        for task in tasks:
+            # Variables declared by a previous task are only known at runtime, so they are not bound on instantiation
+            slots = tuple(
+                (property_name, property_value[1:])
+                for property_name, property_value in task.properties.items()
+                if isinstance(property_value, str) and property_value.startswith("$")
+                and property_value[1:] not in shadowed
+            )
+            declared = frozenset(output for output in task.outputs.values() if output is not None and output != "")
+            subtasks = tuple(
+                (subtask_name, cls.compile(subtask_list, shadowed | declared))
+                for subtask_name, subtask_list in task.subtasks.items()
+            ) if task.subtasks is not None else None
+
+            templates.append(cls(task=task, slots=slots, subtasks=subtasks))
+            shadowed = shadowed | declared
+        return tuple(templates)
+
+    def instantiate(self, prefix: str, variables: dict[str, Any]) -> flow.FlowTask:
+        """"""
+        # Instances share every unbound value with the template, so they must be replaced rather than mutated
+        properties = self.task.properties
+        bound_properties = {
+            property_name: variables[variable_name]
+            for property_name, variable_name in self.slots
+            if variables.get(variable_name) is not None
+        }
+        if bound_properties:
+            properties = {**properties, **bound_properties}
+
+        return flow.FlowTask(
+            id=f"{prefix}{self.task.id}",
+            name=self.task.name,
+            displayName=self.task.displayName,
+            type=self.task.type,
+            properties=properties,
+            outputs=self.task.outputs,
+            subtasks={
+                subtask_name: [template.instantiate(prefix, variables) for template in templates]
+                for subtask_name, templates in self.subtasks
+            } if self.subtasks is not None else None,
+            source=self.task.source or self.task,
+        )
@@ -0,0 +1,215 @@
+""""""
+from typing import Any, Self
+import collections
+import dataclasses
+import hashlib
+import json
+import threading
+
+from penflowexecutor import config, exceptions, models
+from penflowexecutor.adapters import plugins
+from penflowexecutor.models import plugins as plugins_models
+from penflowexecutor.services import context, scheduler
+
+
+@dataclasses.dataclass(frozen=True)
+class PropertyBinder:
+    """"""
+    slots: tuple[tuple[str, str], ...]  # (property name, variable name) pairs
+
+    @classmethod
+    def compile(cls, properties: dict[str, Any]) -> Self:
+        """"""
+        return cls(slots=tuple(
+            (property_name, property_value[1:])
+            for property_name, property_value in properties.items()
+            if isinstance(property_value, str) and property_value.startswith("$")
+        ))
+
+    def bind(self, ctx: context.Context, properties: dict[str, Any]) -> dict[str, Any]:
+        """"""
+        bound_properties = {}
+        for property_name, variable_name in self.slots:
+            # Slots may have already been bound when the task was instantiated from a template
+            if properties.get(property_name) != f"${variable_name}":
+                continue
+            variable = ctx.get_variable(variable_name)
+            if variable is None:
+                raise exceptions.PenflowRuntimeError(
+                    origin=ctx.current_task.id,
+                    detail=f"Variable '{variable_name}' is not declared"
+                )
+            bound_properties[property_name] = variable
+        return {**properties, **bound_properties}
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledTask:
+    """"""
+    task_class: type[plugins_models.Task]
+    binder: PropertyBinder
+
+
+class ExecutionPlan:
+    """"""
+
+    def __init__(self, flow: models.Flow, digest: str):
+        self._flow = flow
+        self._digest = digest
+        self._tasks: dict[str, CompiledTask] = {}
+        self._graphs: dict[tuple[str, ...], scheduler.TaskGraph] = {}
+        self._streams: dict[tuple[str, str], bool] = {}
+        self._compile_tasks(flow.tasks)
+
+    @property
+    def flow(self) -> models.Flow:
+        """"""
+        return self._flow
+
+    @property
+    def digest(self) -> str:
+        """"""
+        return self._digest
+
+    @property
+    def graph(self) -> scheduler.TaskGraph:
+        """"""
+        return self.get_graph(self._flow.tasks)
+
+    def get_task(self, task: models.FlowTask) -> CompiledTask:
+        """"""
+        compiled_task = self._tasks.get((task.source or task).id)
+        # Tasks resolved at runtime by behavioral tasks may not be part of the flow
+        return compiled_task if compiled_task is not None else compile_task(task)
+
+    def is_streaming(self, task: models.FlowTask) -> bool:
+        """"""
+        return issubclass(self.get_task(task).task_class, plugins_models.StreamingTask)
+
+    def streams_to(self, producer: models.FlowTask, consumer: models.FlowTask) -> bool:
+        """"""
+        key = ((producer.source or producer).id, (consumer.source or consumer).id)
+        streams = self._streams.get(key)
+        if streams is None:
+            streams = self._streams[key] = self._streams_to(producer, consumer)
+        return streams
+
+    def _streams_to(self, producer: models.FlowTask, consumer: models.FlowTask) -> bool:
+        if not self.is_streaming(producer):
+            return False
+
+        # The consumer may only read what the producer declares through its streamed properties, anything else it or
+        # its subtasks read must wait for the producer to finish
+        streamed_properties = self.get_task(consumer).task_class.streamed_properties
+        streamed_inputs = scheduler.get_task_inputs(dataclasses.replace(
+            consumer,
+            properties={name: value for name, value in consumer.properties.items() if name in streamed_properties},
+            subtasks=None
+        ))
+        other_inputs = scheduler.get_task_inputs(dataclasses.replace(
+            consumer,
+            properties={name: value for name, value in consumer.properties.items() if name not in streamed_properties}
+        ))
+        producer_outputs = scheduler.get_task_outputs(producer)
+        consumer_outputs = scheduler.get_task_outputs(consumer)
+        return (
+            bool(producer_outputs & streamed_inputs)
+            and not producer_outputs & other_inputs
+            and not producer_outputs & consumer_outputs
+            and not consumer_outputs & scheduler.get_task_inputs(producer)
+        )
+
+    def get_graph(self, tasks: list[models.FlowTask]) -> scheduler.TaskGraph:
+        """"""
+        graph = self._graphs.get(tuple((task.source or task).id for task in tasks))
+        return graph.with_tasks(tasks) if graph is not None else scheduler.TaskGraph(tasks)
+
+    def _compile_tasks(self, tasks: list[models.FlowTask]) -> dict[str, str]:
+        self._graphs[tuple(task.id for task in tasks)] = scheduler.TaskGraph(tasks)
+        # Variables declared within isolated scopes, by the id of the task owning the scope, that no later task can read
+        scoped = {}
+        for task in tasks:
+            compiled_task = self._tasks[task.id] = compile_task(task)
+            nested_scoped = {}
+            for subtasks in (task.subtasks or {}).values():
+                nested_scoped |= self._compile_tasks(subtasks)
+
+            read_scoped = scheduler.get_task_inputs(task) & scoped.keys()
+            if read_scoped:
+                variable_name = min(read_scoped)
+                raise exceptions.PenflowValidationError(
+                    f"Variable '{variable_name}' read by task {task.id} is declared within {scoped[variable_name]}, "
+                    f"whose iterations run concurrently in their own scope"
+                )
+
+            outputs = scheduler.get_task_outputs(task)
+            if (
+                issubclass(compiled_task.task_class, plugins_models.BehavioralTask)
+                and compiled_task.task_class.isolates_subtasks(task.properties)
+            ):
+                scoped |= dict.fromkeys(outputs, task.id)
+            else:
+                # Declaring a variable again makes it visible to the tasks that follow
+                scoped = {name: owner for name, owner in scoped.items() if name not in outputs} | nested_scoped
+        return scoped
+
+
+def compile_task(task: models.FlowTask) -> CompiledTask:
+    """"""
+    try:
+        task_class = plugins.PluginRegistry().get(task.name)
+    except exceptions.PenflowBootError as e:
+        raise exceptions.PenflowValidationError(f"Could not load implementation for task {task.name}, {e.message}")
+    if task_class is None:
+        raise exceptions.PenflowValidationError(
+            f"Could not find implementation for task {task.name} with id {task.id}"
+        )
+
+    expected_class = {
+        models.TaskType.RUNNABLE: plugins_models.RunnableTask,
+        models.TaskType.BEHAVIORAL: plugins_models.BehavioralTask,
+    }[task.type]
+    if not issubclass(task_class, expected_class):
+        raise exceptions.PenflowValidationError(
+            f"Wrong implementation for {task.name} of type '{task.type}' with id {task.id}"
+        )
+
+    return CompiledTask(task_class=task_class, binder=PropertyBinder.compile(task.properties))
+
+
+DEFAULT_CACHE_SIZE = config.get_plan_cache_size()
+""""""
+
+
+class FlowCompiler:
+    """"""
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._cache_size = cache_size
+        self._plans: collections.OrderedDict[str, ExecutionPlan] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, flow: models.Flow | dict[str, Any]) -> ExecutionPlan:
+        """"""
+        flow_data = flow.to_dict() if isinstance(flow, models.Flow) else flow
+        digest = hashlib.sha256(json.dumps(flow_data, sort_keys=True).encode()).hexdigest()
+
+        with self._lock:
+            plan = self._plans.get(digest)
+            if plan is not None:
+                self._plans.move_to_end(digest)
+                return plan
+
+        try:
+            plan = ExecutionPlan(
+                flow=flow if isinstance(flow, models.Flow) else models.Flow.from_dict(flow_data),
+                digest=digest
+            )
+        except (KeyError, ValueError, TypeError) as e:
+            raise exceptions.PenflowValidationError(f"Malformed flow, {e}")
+
+        with self._lock:
+            self._plans[digest] = plan
+            while len(self._plans) > self._cache_size:
+                self._plans.popitem(last=False)
+        return plan
@@ -1,5 +1,7 @@
 """"""
-from typing import Any
+from typing import Any, Self
+import collections
+import copy
 
 from penflowexecutor import exceptions, models
 
@@ -10,7 +12,9 @@ class Context:
     def __init__(self, execution_id: str, arguments: dict[str, Any]):
         self._execution_id = execution_id
         self._current_task: models.FlowTask | None = None
-        self._variables = arguments.copy()
+        self._variables = collections.ChainMap(arguments.copy())
+        self._completed_tasks: set[str] = set()
+        self._uncheckpointed_tasks: list[str] = []
 
     @property
     def execution_id(self) -> str:
@@ -27,6 +31,50 @@ class Context:
         """"""
         self._current_task = task
 
+    @property
+    def is_scoped(self) -> bool:
+        """"""
+        return len(self._variables.maps) > 1
+
+    @property
+    def completed_tasks(self) -> set[str]:
+        """"""
+        return self._completed_tasks
+
+    def complete_task(self, task_id: str):
+        """"""
+        self._completed_tasks.add(task_id)
+        self._uncheckpointed_tasks.append(task_id)
+
+    def pop_uncheckpointed_tasks(self) -> set[str]:
+        """"""
+        # Forked contexts share the list, so it is emptied instead of replaced
+        task_ids = set(self._uncheckpointed_tasks)
+        self._uncheckpointed_tasks.clear()
+        return task_ids
+
+    def snapshot(self) -> dict[str, Any]:
+        """"""
+        # Only variables of the root scope outlive the task that set them
+        return dict(self._variables.maps[-1])
+
+    def restore(self, variables: dict[str, Any], completed_tasks: set[str]):
+        """"""
+        self._variables.maps[-1].update(variables)
+        self._completed_tasks.update(completed_tasks)
+
+    def fork(self) -> Self:
+        """"""
+        # Forked contexts share variables but track their own current task
+        return copy.copy(self)
+
+    def scope(self, variables: dict[str, Any] | None = None) -> Self:
+        """"""
+        # Variables set within the scope shadow the parent ones and are discarded with it
+        scoped_ctx = copy.copy(self)
+        scoped_ctx._variables = self._variables.new_child(dict(variables or {}))
+        return scoped_ctx
+
     def get_variable(self, name: str) -> Any:
         """"""
         return self._variables.get(name)
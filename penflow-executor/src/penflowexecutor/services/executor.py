@@ -1,124 +1,380 @@
-from typing import Any
+from typing import Any, AsyncIterator, Iterable
+import asyncio
+import collections.abc
 import os
+import time
 
 from penflowexecutor import exceptions, models
-from penflowexecutor.adapters import eventpublisher, plugins
+from penflowexecutor.adapters import checkpointstore, eventpublisher, resultcache
 from penflowexecutor.models import messages, plugins as plugins_models
-from penflowexecutor.services import context
+from penflowexecutor.services import compiler as flow_compiler, context, scheduler
 
 
 class FlowExecutor:
 
-    def __init__(self, publisher: eventpublisher.EventPublisher):
+    def __init__(
+        self,
+        publisher: eventpublisher.EventPublisher,
+        compiler: flow_compiler.FlowCompiler | None = None,
+        cache: resultcache.ResultCache | None = None,
+        checkpoints: checkpointstore.CheckpointStore | None = None,
+        checkpoint_interval: float = checkpointstore.DEFAULT_CHECKPOINT["interval"]
+    ):
         self.eventpublisher = publisher
-        self.ctx = None
+        self.compiler = compiler or flow_compiler.FlowCompiler()
+        self.cache = cache or resultcache.make_cache()
+        self.checkpoints = checkpoints or checkpointstore.make_store()
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoint_locks: dict[str, asyncio.Lock] = {}  # By execution
+        self._checkpointed_at: dict[str, float] = {}  # By execution
+        self._checkpoint_saves: dict[str, asyncio.Future] = {}  # Last save of each execution
+
+    def run(self, flow: models.Flow | dict[str, Any], ctx: context.Context):
+        """"""
+        asyncio.run(self.run_async(flow, ctx))
 
-    def run(self, flow: models.Flow, ctx: context.Context):
+    async def run_async(self, flow: models.Flow | dict[str, Any], ctx: context.Context):
         """"""
+        try:
+            plan = self.compiler.compile(flow)
+        except exceptions.PenflowValidationError as e:
+            # Notify flow could not be started
+            self.eventpublisher.connect()
+            try:
+                self.eventpublisher.publish(messages.FlowFinishedPrematurely(ctx.execution_id, detail=e.message))
+            finally:
+                await self.eventpublisher.aclose(ctx.execution_id)
+            raise e
+
+        graph = plan.graph
         try:
             # Init execution
-            self.ctx = ctx
             self.eventpublisher.connect()
 
+            # Resume a redelivered execution from its last checkpoint, unless the flow changed since then
+            checkpoint = await asyncio.to_thread(self.checkpoints.load, ctx.execution_id)
+            if checkpoint is not None and checkpoint.digest == plan.digest:
+                ctx.restore(checkpoint.variables, checkpoint.completed_tasks)
+                print(f"{os.getpid()}:{ctx.execution_id} - Resuming after {len(checkpoint.completed_tasks)} tasks")
+
             # Start execution
-            self.eventpublisher.publish(messages.FlowStarted(self.ctx.execution_id))
-            print(f"{os.getpid()}:{self.ctx.execution_id} - Started")
-            self._run_tasks(flow.tasks)
-            self.eventpublisher.publish(messages.FlowFinished(self.ctx.execution_id))
-            print(f"{os.getpid()}:{self.ctx.execution_id} - Successfully finished")
+            self.eventpublisher.publish(messages.FlowStarted(ctx.execution_id))
+            print(f"{os.getpid()}:{ctx.execution_id} - Started")
+            await self._run_graph(graph, ctx, plan)
+            self.eventpublisher.publish(messages.FlowFinished(ctx.execution_id, critical_path=graph.critical_path))
+            print(f"{os.getpid()}:{ctx.execution_id} - Successfully finished")
         except exceptions.PenflowRuntimeError as e:
             # Notify task fail (Controlled)
             self.eventpublisher.publish(messages.TaskFinished(
-                self.ctx.execution_id,
-                self.ctx.current_task.id,
+                ctx.execution_id,
+                ctx.current_task.id,
+                ctx.current_task.name,
                 success=False,
                 detail=e.message
             ))
             # Notify flow failed
             self.eventpublisher.publish(messages.FlowFinished(
-                self.ctx.execution_id,
+                ctx.execution_id,
                 success=False,
-                detail=f"Task with id {e.origin} failed: {e.message}"
+                detail=f"Task with id {e.origin or ctx.current_task.id} failed: {e.message}",
+                critical_path=graph.critical_path
             ))
             raise e
         except Exception as e:
             # Notify task fail (Uncontrolled)
             self.eventpublisher.publish(messages.TaskFinished(
-                self.ctx.execution_id,
-                self.ctx.current_task.id,
+                ctx.execution_id,
+                ctx.current_task.id,
+                ctx.current_task.name,
                 success=False,
                 detail=str(e)
             ))
             # Notify flow failed
             self.eventpublisher.publish(messages.FlowFinished(
-                self.ctx.execution_id,
+                ctx.execution_id,
                 success=False,
-                detail=f"Task with id {self.ctx.current_task.id} failed: {e}"
+                detail=f"Task with id {ctx.current_task.id} failed: {e}",
+                critical_path=graph.critical_path
             ))
             raise exceptions.PenflowRuntimeError(
-                origin=self.ctx.current_task.id,
+                origin=ctx.current_task.id,
                 detail=str(e)
             ) from None
         finally:
-            self.eventpublisher.close()
+            self._checkpoint_locks.pop(ctx.execution_id, None)
+            self._checkpointed_at.pop(ctx.execution_id, None)
+            # A save still running in its thread would otherwise store the checkpoint again after it is deleted
+            saving = self._checkpoint_saves.pop(ctx.execution_id, None)
+            if saving is not None:
+                await asyncio.gather(saving, return_exceptions=True)
+            await asyncio.to_thread(self.checkpoints.delete, ctx.execution_id)
+            await self.eventpublisher.aclose(ctx.execution_id)
 
-    def _run_tasks(self, tasks: list[models.FlowTask]):
+    async def _run_tasks(self, tasks: list[models.FlowTask], ctx: context.Context, plan: flow_compiler.ExecutionPlan):
         """"""
-        for task_meta in tasks:
-            # Notify task start
-            self.eventpublisher.publish(messages.TaskStarted(self.ctx.execution_id, task_meta.id, task_meta.name))
-            print(f"{os.getpid()}:{self.ctx.execution_id} - Running task {task_meta.name}:{task_meta.id}")
-
-            self.ctx.current_task = task_meta
-            parsed_properties = self.ctx.render_properties(task_meta.properties)
-            task_class = plugins.PluginRegistry().get(task_meta.name)
-            if task_class is None:
-                raise exceptions.PenflowRuntimeError(
-                    origin=task_meta.id,
-                    detail=f"Could not find implementation for task {task_meta.name} with id {task_meta.id}"
-                )
-            task = task_class(parsed_properties)
-            output = None
-            steps = None
-
-            match task_meta.type:
-                case models.TaskType.RUNNABLE: output, steps = self._run_runnable_task(task, task_meta)
-                case models.TaskType.BEHAVIORAL: self._run_behavioral_task(task, task_meta)
-
-            # Notify task finished
-            self.eventpublisher.publish(messages.TaskFinished(
-                self.ctx.execution_id,
-                task_meta.id,
-                task_meta.name,
-                output=output,
-                steps=steps
+        await self._run_graph(plan.get_graph(tasks), ctx, plan)
+
+    async def _run_graph(self, graph: scheduler.TaskGraph, ctx: context.Context, plan: flow_compiler.ExecutionPlan):
+        """"""
+        if graph.is_sequential and not any(plan.is_streaming(task_meta) for task_meta in graph.tasks):
+            for task_meta in graph.tasks:
+                await self._run_task(task_meta, ctx, plan)
+            return
+
+        # Dispatch every task whose dependencies are done, each one tracking its own current task. A task may start
+        # before a dependency is done only if it reads its outputs through streamed properties and they are streaming
+        done = set()
+        available = set()
+        running = {}
+        streaming = {}
+        try:
+            while len(done) < len(graph.tasks):
+                dispatched = done | {index for index, _ in running.values()}
+                for index in graph.ready(available):
+                    task_meta = graph.tasks[index]
+                    if index in dispatched:
+                        continue
+                    pending = graph.get_dependencies(index) - done
+                    if any(not plan.streams_to(graph.tasks[dependency], task_meta) for dependency in pending):
+                        continue
+                    forked_ctx = ctx.fork()
+                    started = asyncio.Event() if plan.is_streaming(task_meta) else None
+                    running[asyncio.create_task(self._run_task(task_meta, forked_ctx, plan, started))] = (index, forked_ctx)
+                    if started is not None:
+                        streaming[asyncio.create_task(started.wait())] = index
+
+                finished, _ = await asyncio.wait([*running, *streaming], return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    if future in streaming:
+                        available.add(streaming.pop(future))
+                        continue
+                    index, forked_ctx = running.pop(future)
+                    if future.exception() is not None:
+                        ctx.current_task = forked_ctx.current_task
+                        raise future.exception()
+                    done.add(index)
+                    available.add(index)
+        finally:
+            await self._cancel(running)
+            await self._cancel(streaming)
+
+    async def _run_task(
+        self,
+        task_meta: models.FlowTask,
+        ctx: context.Context,
+        plan: flow_compiler.ExecutionPlan,
+        started: asyncio.Event | None = None
+    ):
+        """"""
+        if task_meta.id in ctx.completed_tasks:
+            print(f"{os.getpid()}:{ctx.execution_id} - Task {task_meta.name}:{task_meta.id} already completed")
+            return
+
+        # Notify task start
+        self.eventpublisher.publish(messages.TaskStarted(ctx.execution_id, task_meta.id, task_meta.name))
+        print(f"{os.getpid()}:{ctx.execution_id} - Running task {task_meta.name}:{task_meta.id}")
+
+        ctx.current_task = task_meta
+        compiled_task = plan.get_task(task_meta)
+        parsed_properties = compiled_task.binder.bind(ctx, task_meta.properties)
+        task = compiled_task.task_class(parsed_properties)
+        output = None
+        steps = None
+        cached = False
+
+        match task_meta.type:
+            case models.TaskType.RUNNABLE:
+                output, steps, cached = await self._run_runnable_task(task, task_meta, ctx, parsed_properties, started)
+            case models.TaskType.BEHAVIORAL: await self._run_behavioral_task(task, task_meta, ctx, plan)
+
+        # Notify task finished
+        self.eventpublisher.publish(messages.TaskFinished(
+            ctx.execution_id,
+            task_meta.id,
+            task_meta.name,
+            output=output,
+            steps=steps,
+            cached=cached
+        ))
+        print(f"{os.getpid()}:{ctx.execution_id} - Task {task_meta.name}:{task_meta.id} finished")
+
+        # Tasks within a scope are only checkpointed along with the task owning it, their variables are discarded
+        if not ctx.is_scoped:
+            ctx.complete_task(task_meta.id)
+            # Tasks instantiated by behavioral tasks are checkpointed at most once per interval, the rest every time
+            await self._checkpoint(ctx, plan, throttled=task_meta.source is not None)
+
+    async def _checkpoint(self, ctx: context.Context, plan: flow_compiler.ExecutionPlan, throttled: bool):
+        if isinstance(self.checkpoints, checkpointstore.NullCheckpointStore):
+            return
+
+        lock = self._checkpoint_locks.setdefault(ctx.execution_id, asyncio.Lock())
+        checkpointed_at = self._checkpointed_at.get(ctx.execution_id, 0)
+        if throttled and (lock.locked() or time.monotonic() - checkpointed_at < self.checkpoint_interval):
+            # Completed tasks are kept until the next checkpoint
+            return
+
+        # Checkpoints of the same execution are saved one at a time, so that an older one never overwrites a newer one
+        async with lock:
+            completed_tasks = ctx.pop_uncheckpointed_tasks()
+            if len(completed_tasks) == 0:
+                return
+            self._checkpointed_at[ctx.execution_id] = time.monotonic()
+            saving = self._checkpoint_saves[ctx.execution_id] = asyncio.ensure_future(asyncio.to_thread(
+                self.checkpoints.save,
+                ctx.execution_id,
+                checkpointstore.Checkpoint(digest=plan.digest, variables=ctx.snapshot(), completed_tasks=completed_tasks)
             ))
-            print(f"{os.getpid()}:{self.ctx.execution_id} - Task {task_meta.name}:{task_meta.id} finished")
+            await asyncio.shield(saving)
 
-    def _run_runnable_task(
+    async def _run_runnable_task(
         self,
         task: plugins_models.RunnableTask,
-        task_meta: models.FlowTask
-    ) -> tuple[dict[str, Any], list[str]]:
+        task_meta: models.FlowTask,
+        ctx: context.Context,
+        properties: dict[str, Any],
+        started: asyncio.Event | None = None
+    ) -> tuple[dict[str, Any], list[str], bool]:
         if not isinstance(task, plugins_models.RunnableTask):
             raise exceptions.PenflowRuntimeError(
                 origin=task_meta.id,
                 detail=f"Wrong implementation for {task_meta.name} of type 'runnable'."
             )
 
-        output = task.run(self.ctx)
+        # Opted-in tasks reuse the result of a previous run with the same rendered properties
+        cache_key = resultcache.make_key(task_meta.name, task.version, properties) if task.cache_ttl > 0 else None
+        result = await self.cache.aget(cache_key) if cache_key is not None else None
+
+        if result is not None:
+            output, steps = result["output"], result["steps"]
+        else:
+            if isinstance(task, plugins_models.StreamingTask):
+                output = await self._run_streaming_task(task, task_meta, ctx, started)
+            elif isinstance(task, plugins_models.AsyncRunnableTask):
+                output = await task.run(ctx)
+            else:
+                # Blocking tasks run in a thread so that they do not stall the event loop
+                output = await asyncio.to_thread(task.run, ctx)
+            steps = task.steps
+            if cache_key is not None:
+                await self.cache.aset(cache_key, {"output": output, "steps": steps}, task.cache_ttl)
 
         for output_name, output_value in task_meta.outputs.items():
             if output_value is not None and output_value != "":
-                self.ctx.set_variable(output_value, output[output_name])
+                ctx.set_variable(output_value, output[output_name])
+
+        return output, steps, result is not None
 
-        return output, task.steps
+    async def _run_streaming_task(
+        self,
+        task: plugins_models.StreamingTask,
+        task_meta: models.FlowTask,
+        ctx: context.Context,
+        started: asyncio.Event | None = None
+    ) -> dict[str, Any]:
+        # Outputs are bound to channels filled while the task runs, tasks consuming them do not wait for it to finish
+        channels = collections.defaultdict(plugins_models.Channel)
+        for output_name, output_value in task_meta.outputs.items():
+            if output_value is not None and output_value != "":
+                ctx.set_variable(output_value, channels[output_name])
+        if started is not None:
+            started.set()
+
+        try:
+            await task.stream(ctx, channels)
+        finally:
+            for channel in channels.values():
+                channel.close()
+        return {output_name: channel.items for output_name, channel in channels.items()}
 
-    def _run_behavioral_task(self, task: plugins_models.BehavioralTask, task_meta: models.FlowTask):
+    async def _run_behavioral_task(
+        self,
+        task: plugins_models.BehavioralTask,
+        task_meta: models.FlowTask,
+        ctx: context.Context,
+        plan: flow_compiler.ExecutionPlan
+    ):
         if not isinstance(task, plugins_models.BehavioralTask):
             raise exceptions.PenflowRuntimeError(
                 origin=task_meta.id,
                 detail=f"Wrong implementation for {task_meta.name} of type 'behavioral'."
             )
 
-        self._run_tasks(task.resolve(self.ctx))
+        iterations = task.iterations(ctx)
+        if task.parallelism > 1:
+            await self._run_iterations_concurrently(iterations, task.parallelism, ctx, plan)
+            return
+
+        async for iteration in self._iterate(iterations):
+            for variable_name, variable_value in iteration.variables.items():
+                ctx.set_variable(variable_name, variable_value)
+            await self._run_tasks(iteration.tasks, ctx, plan)
+            # Iterations are resolved lazily, the next one is resolved on behalf of the behavioral task again
+            ctx.current_task = task_meta
+
+    async def _run_iterations_concurrently(
+        self,
+        iterations: Iterable[plugins_models.Iteration] | AsyncIterator[plugins_models.Iteration],
+        parallelism: int,
+        ctx: context.Context,
+        plan: flow_compiler.ExecutionPlan
+    ):
+        # Iterations are pulled lazily, only when a slot is free, so that at most `parallelism` are materialised.
+        # Each one runs in its own scope so that concurrent iterations do not overwrite each other variables
+        is_async = isinstance(iterations, collections.abc.AsyncIterator)
+        iterations = iterations if is_async else iter(iterations)
+        running = {}
+        pulling = None  # Next iteration of an asynchronous iterator, awaited along with the running ones
+        exhausted = False
+
+        def start(iteration: plugins_models.Iteration):
+            scoped_ctx = ctx.scope(iteration.variables)
+            running[asyncio.create_task(self._run_tasks(iteration.tasks, scoped_ctx, plan))] = scoped_ctx
+
+        try:
+            while True:
+                while not exhausted and pulling is None and len(running) < parallelism:
+                    if is_async:
+                        pulling = asyncio.ensure_future(anext(iterations, None))
+                    elif (iteration := next(iterations, None)) is not None:
+                        start(iteration)
+                    else:
+                        exhausted = True
+                if not running and pulling is None:
+                    break
+
+                finished, _ = await asyncio.wait([*running, *filter(None, [pulling])], return_when=asyncio.FIRST_COMPLETED)
+                if pulling in finished:
+                    iteration = pulling.result()
+                    pulling = None
+                    if iteration is not None:
+                        start(iteration)
+                    else:
+                        exhausted = True
+                for future in finished & running.keys():
+                    scoped_ctx = running.pop(future)
+                    if future.exception() is not None:
+                        # Report the failure against the task that actually failed within the iteration
+                        ctx.current_task = scoped_ctx.current_task
+                        raise future.exception()
+        finally:
+            await self._cancel(running)
+            if pulling is not None:
+                await self._cancel({pulling: None})
+
+    @staticmethod
+    async def _iterate(
+        iterations: Iterable[plugins_models.Iteration] | AsyncIterator[plugins_models.Iteration]
+    ) -> AsyncIterator[plugins_models.Iteration]:
+        if isinstance(iterations, collections.abc.AsyncIterator):
+            async for iteration in iterations:
+                yield iteration
+        else:
+            for iteration in iterations:
+                yield iteration
+
+    @staticmethod
+    async def _cancel(running: dict[asyncio.Task, Any]):
+        for future in running:
+            future.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
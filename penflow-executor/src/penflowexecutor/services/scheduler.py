@@ -0,0 +1,87 @@
+""""""
+from typing import Self
+import copy
+
+from penflowexecutor import models
+
+
+def get_task_inputs(task: models.FlowTask) -> set[str]:
+    """"""
+    inputs = {
+        property_value[1:]
+        for property_value in task.properties.values()
+        if isinstance(property_value, str) and property_value.startswith("$")
+    }
+    # Subtasks may also read variables declared outside the task, except those bound by the task itself
+    for subtasks in (task.subtasks or {}).values():
+        for subtask in subtasks:
+            inputs |= get_task_inputs(subtask)
+    return inputs - set(task.outputs.values()) if task.subtasks else inputs
+
+
+def get_task_outputs(task: models.FlowTask) -> set[str]:
+    """"""
+    outputs = {output_value for output_value in task.outputs.values() if output_value is not None and output_value != ""}
+    for subtasks in (task.subtasks or {}).values():
+        for subtask in subtasks:
+            outputs |= get_task_outputs(subtask)
+    return outputs
+
+
+class TaskGraph:
+    """"""
+
+    def __init__(self, tasks: list[models.FlowTask]):
+        self._tasks = tasks
+        self._dependencies: list[set[int]] = []
+        self._depths: list[int] = []
+        self._build()
+
+    @property
+    def tasks(self) -> list[models.FlowTask]:
+        """"""
+        return self._tasks
+
+    @property
+    def critical_path(self) -> int:
+        """"""
+        return max(self._depths, default=0)
+
+    @property
+    def is_sequential(self) -> bool:
+        """"""
+        return self.critical_path == len(self._tasks)
+
+    def with_tasks(self, tasks: list[models.FlowTask]) -> Self:
+        """"""
+        # Instances of the same tasks share the dependencies, so they are not computed again
+        graph = copy.copy(self)
+        graph._tasks = tasks
+        return graph
+
+    def get_dependencies(self, index: int) -> set[int]:
+        """"""
+        return self._dependencies[index]
+
+    def ready(self, done: set[int]) -> list[int]:
+        """"""
+        return [
+            index for index, dependencies in enumerate(self._dependencies)
+            if index not in done and dependencies <= done
+        ]
+
+    def _build(self):
+        inputs = [get_task_inputs(task) for task in self._tasks]
+        outputs = [get_task_outputs(task) for task in self._tasks]
+
+        for index in range(len(self._tasks)):
+            # A task must wait for any previous task that declares a variable it reads (read after write), reads a
+            # variable it declares (write after read) or declares the same variable (write after write)
+            dependencies = {
+                previous for previous in range(index)
+                if inputs[index] & outputs[previous]
+                or outputs[index] & inputs[previous]
+                or outputs[index] & outputs[previous]
+            }
+            self._dependencies.append(dependencies)
+            self._depths.append(1 + max((self._depths[dependency] for dependency in dependencies), default=0))
@@ -0,0 +1,86 @@
+"""
+Compares executor startup time between importing every plugin (PLUGINS_LAZY=false) and indexing them from their
+metadata (PLUGINS_LAZY=true) as the number of plugins grows. Each plugin imports a few standard library modules,
+like real plugins do, and every measurement runs on a fresh interpreter.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+PLUGIN_COUNTS = [10, 50, 100, 250, 500]
+RUNS = 3
+
+PLUGIN_TEMPLATE = textwrap.dedent("""
+    from typing import Any, override
+    import enum
+    import ipaddress
+    import xml.etree.ElementTree
+
+    from penflowexecutor.adapters import plugins
+    from penflowexecutor.models import plugins as plugins_models
+
+
+    plugin_registry = plugins.PluginRegistry()
+
+
+    @plugin_registry.register("{name}")
+    class Plugin(plugins_models.RunnableTask):
+
+        def __init__(self, properties: dict[str, Any]):
+            super().__init__()
+
+        @override
+        def run(self, ctx):
+            return {{}}
+""")
+
+STARTUP = textwrap.dedent("""
+    import sys, time
+    t = time.perf_counter()
+    from penflowexecutor.adapters import plugins
+    if sys.argv[2] == "lazy":
+        plugins.PluginRegistry().index(sys.argv[1])
+    else:
+        plugins.load_plugins(sys.argv[1])
+    booted = time.perf_counter()
+    plugins.PluginRegistry().get("bench.plugin_0")
+    print(booted - t, time.perf_counter() - booted)
+""")
+
+
+def make_plugins(path: str, count: int):
+    open(os.path.join(path, "__init__.py"), "w").close()
+    os.makedirs(os.path.join(path, "bench"))
+    open(os.path.join(path, "bench", "__init__.py"), "w").close()
+    for i in range(count):
+        plugin_path = os.path.join(path, "bench", f"plugin_{i}")
+        os.makedirs(plugin_path)
+        with open(os.path.join(plugin_path, "__init__.py"), "w") as f:
+            f.write("from . import main\n")
+        with open(os.path.join(plugin_path, "main.py"), "w") as f:
+            f.write(PLUGIN_TEMPLATE.format(name=f"bench.plugin_{i}"))
+        with open(os.path.join(plugin_path, "metadata.json"), "w") as f:
+            json.dump({"name": f"bench.plugin_{i}", "type": "runnable", "properties": {}, "outputs": {}}, f)
+
+
+def measure(path: str, mode: str) -> tuple[float, float]:
+    samples = []
+    for _ in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP, path, mode],
+            capture_output=True, text=True, check=True
+        )
+        samples.append(tuple(float(value) for value in result.stdout.split()))
+    return min(samples)
+
+
+print(f"{'plugins':>8} {'eager boot':>12} {'lazy boot':>12} {'lazy first get':>15} {'speedup':>8}")
+for count in PLUGIN_COUNTS:
+    with tempfile.TemporaryDirectory() as path:
+        make_plugins(path, count)
+        eager, _ = measure(path, "eager")
+        lazy, first_get = measure(path, "lazy")
+        print(f"{count:>8} {eager * 1000:>10.1f}ms {lazy * 1000:>10.1f}ms {first_get * 1000:>13.1f}ms {eager / lazy:>7.1f}x")
@@ -1,8 +1,7 @@
 from typing import Any, override
-import copy
 import enum
 
-from penflowexecutor import exceptions
+from penflowexecutor import exceptions, models
 from penflowexecutor.adapters import plugins
 from penflowexecutor.models import plugins as plugins_models
 from penflowexecutor.services import context
@@ -16,29 +15,73 @@ class ForEach(plugins_models.BehavioralTask):
 
     class Properties(enum.StrEnum):
         LIST = "list"  # Required
+        PARALLELISM = "parallelism"  # Optional, default 1
+
+    streamed_properties = (Properties.LIST,)
 
     def __init__(self, properties: dict[str, Any]):
         self._list = properties.get(self.Properties.LIST)
+        self.parallelism = max(int(properties.get(self.Properties.PARALLELISM) or 1), 1)
+
+    @classmethod
+    @override
+    def isolates_subtasks(cls, properties: dict[str, Any]) -> bool:
+        # Concurrent iterations run in their own scope. A parallelism bound to a variable is only known at runtime
+        try:
+            return int(properties.get(cls.Properties.PARALLELISM) or 1) > 1
+        except (TypeError, ValueError):
+            return False
 
     @override
     def resolve(self, ctx: context.Context):
+        for iteration in self.iterations(ctx):
+            # Set Variables
+            for variable_name, variable_value in iteration.variables.items():
+                ctx.set_variable(variable_name, variable_value)
+            # Render task
+            for task in iteration.tasks:
+                task.properties = ctx.render_properties(task.properties)
+                yield task
+
+    @override
+    def iterations(self, ctx: context.Context):
         subtasks = ctx.current_task.subtasks
         if subtasks is None or "foreach" not in subtasks:
             raise exceptions.PenflowRuntimeError(
                 origin=ctx.current_task.id,
-                details=f"No subtasks found for foreach task with id {ctx.current_task.id}"
+                detail=f"No subtasks found for foreach task with id {ctx.current_task.id}"
             )
 
-        total_subtasks = []
-        for index, item in enumerate(self._list):
-            # Set Variables
-            for output_name, output_value in ctx.current_task.outputs.items():
-                if output_value is not None and output_value != "":
-                    ctx.set_variable(output_value, item)
-            # Render task
-            for task in copy.deepcopy(subtasks["foreach"]):
-                task.id = f"{index}:{task.id}"
-                task.properties = ctx.render_properties(task.properties)
-                # Append subtasks
-                total_subtasks.append(task)
-        return total_subtasks
+        # Subtasks are compiled once, each iteration only binds its variables and prefixes the ids
+        templates = models.TaskTemplate.compile(subtasks["foreach"])
+        task_outputs = ctx.current_task.outputs
+
+        # Iterations are yielded on demand so that only the ones being executed are materialised
+        if isinstance(self._list, plugins_models.Channel):
+            # Items of a channel are iterated as they are produced
+            return self._iterate_channel(templates, task_outputs)
+        return (self._iteration(templates, task_outputs, index, item) for index, item in enumerate(self._list))
+
+    async def _iterate_channel(self, templates: list[models.TaskTemplate], task_outputs: dict[str, str]):
+        index = 0
+        async for item in self._list:
+            yield self._iteration(templates, task_outputs, index, item)
+            index += 1
+
+    @staticmethod
+    def _iteration(
+        templates: list[models.TaskTemplate],
+        task_outputs: dict[str, str],
+        index: int,
+        item: Any
+    ) -> plugins_models.Iteration:
+        # Bind outputs
+        outputs = {"index": index, "item": item}
+        variables = {
+            output_value: outputs.get(output_name)
+            for output_name, output_value in task_outputs.items()
+            if output_value is not None and output_value != ""
+        }
+        # Instantiate tasks
+        tasks = [template.instantiate(f"{index}:", variables) for template in templates]
+        return plugins_models.Iteration(variables=variables, tasks=tasks)
@@ -0,0 +1,86 @@
+from typing import Any, override
+import asyncio
+import contextlib
+import enum
+import socket
+
+from penflowexecutor.adapters import plugins
+from penflowexecutor.models import plugins as plugins_models
+from penflowexecutor.services import context
+
+from nmap import utils
+from nmap.exceptions import NmapRuntimeException
+from nmap.nmap_results import NmapPort, PortState, intern
+
+
+plugin_registry = plugins.PluginRegistry()
+
+
+DEFAULT_PORTS = "1-1024"
+DEFAULT_CONCURRENCY = 256
+DEFAULT_TIMEOUT = 1.0
+
+
+@plugin_registry.register("net.tcp_connect_scan")
+class TcpConnectScan(plugins_models.AsyncRunnableTask):
+    class Properties(enum.StrEnum):
+        HOST = "host"  # Required
+        PORTS = "ports"  # Optional, default 1-1024
+        CONCURRENCY = "concurrency"  # Optional, default 256
+        TIMEOUT = "timeout"  # Optional, default 1 second
+        CACHE_TTL = "cacheTtl"  # Optional, seconds results are reused for the same properties, default 0 (disabled)
+
+    def __init__(self, properties: dict[str, Any]):
+        super().__init__()
+        self._host = properties.get(self.Properties.HOST)
+        utils.validate_ipv4(self._host)
+
+        self._port_ranges = utils.validate_port_ranges(properties.get(self.Properties.PORTS) or DEFAULT_PORTS)
+
+        try:
+            self._concurrency = max(int(properties.get(self.Properties.CONCURRENCY) or DEFAULT_CONCURRENCY), 1)
+            self._timeout = float(properties.get(self.Properties.TIMEOUT) or DEFAULT_TIMEOUT)
+            self.cache_ttl = max(float(properties.get(self.Properties.CACHE_TTL) or 0), 0)
+        except ValueError as e:
+            raise NmapRuntimeException(f"Invalid scan settings, {e}")
+
+    @override
+    async def run(self, ctx: context.Context):
+        self.add_step(f"tcp connect scan {self._host} -p {self._port_ranges}")
+
+        # A fixed set of probes pulls ports from a shared iterator, so at most `concurrency` sockets are open
+        ports = iter(self._port_ranges)
+        open_ports = []
+
+        async def probe():
+            for port in ports:
+                if await self._is_open(port):
+                    open_ports.append(port)
+
+        await asyncio.gather(*(probe() for _ in range(self._concurrency)))
+
+        return {
+            "address": self._host,
+            "discoveredPorts": [
+                NmapPort(protocol="tcp", port=port, state=PortState.OPEN, service=self._service(port))
+                for port in sorted(open_ports)
+            ],
+        }
+
+    async def _is_open(self, port: int) -> bool:
+        # Refused connections are closed ports and timed out ones filtered, only open ports are reported
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self._host, port), self._timeout)
+        except (asyncio.TimeoutError, OSError):
+            return False
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
+        return True
+
+    @staticmethod
+    def _service(port: int) -> str:
+        try:
+            return intern(socket.getservbyport(port, "tcp"))
+        except OSError:
+            return "unknown"
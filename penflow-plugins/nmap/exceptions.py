@@ -5,3 +5,25 @@ class NmapRuntimeException(exceptions.PenflowRuntimeError):
 
     def __init__(self, message: str) -> None:
         self.message = message
+        self.origin = None  # Reported against the running task
+
+
+class NmapNotFoundException(NmapRuntimeException):
+
+    def __init__(self) -> None:
+        super().__init__("nmap is not installed or not in PATH")
+
+
+class NmapTimeoutException(NmapRuntimeException):
+
+    def __init__(self, timeout: float) -> None:
+        super().__init__(f"Scan did not finish within {timeout:g} seconds")
+        self.timeout = timeout
+
+
+class NmapProcessException(NmapRuntimeException):
+
+    def __init__(self, returncode: int, stderr: str) -> None:
+        super().__init__(f"nmap exited with code {returncode}: {stderr.strip()}")
+        self.returncode = returncode
+        self.stderr = stderr
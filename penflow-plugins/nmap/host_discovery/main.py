@@ -1,10 +1,16 @@
-from typing import Any, override
+from typing import Any, AsyncIterator, override
+import asyncio
+import collections
+import dataclasses
 import enum
+import ipaddress
 
 from penflowexecutor.adapters import plugins
 from penflowexecutor.models import plugins as plugins_models
 from penflowexecutor.services import context
 
+from nmap import nmap_client
+from nmap.exceptions import NmapRuntimeException
 from nmap.nmap_client import NmapClient
 from nmap.nmap_cmd_builder import NmapCommandBuilder
 from nmap.nmap_options import NmapOptions, TargetType, PortScanTechnique
@@ -14,11 +20,13 @@ plugin_registry = plugins.PluginRegistry()
 
 
 @plugin_registry.register("nmap.host_discovery")
-class NmapPortScan(plugins_models.RunnableTask):
-
+class NmapPortScan(plugins_models.StreamingTask):
     class Properties(enum.StrEnum):
         NETWORK = "network"  # Required
         DISCOVERY_TECHNIQUE = "discoveryTechnique"  # Required
+        SHARD_SIZE = "shardSize"  # Optional, prefix length of the sub-networks scanned concurrently
+        TIMEOUT = "timeout"  # Optional, default NMAP_TIMEOUT
+        CACHE_TTL = "cacheTtl"  # Optional, seconds results are reused for the same properties, default 0 (disabled)
 
     def __init__(self, properties: dict[str, Any]):
         super().__init__()
@@ -27,14 +35,55 @@ class NmapPortScan(plugins_models.RunnableTask):
             host_discovery_technique=properties.get(self.Properties.DISCOVERY_TECHNIQUE),
             port_scan_technique=PortScanTechnique.DISABLED,
         )
+        self._timeout = properties.get(self.Properties.TIMEOUT)
+
+        self._shard_size = properties.get(self.Properties.SHARD_SIZE)
+        if self._shard_size is not None:
+            try:
+                self._shard_size = int(self._shard_size)
+            except ValueError:
+                raise NmapRuntimeException(f"Invalid shard size {self._shard_size}")
+            if not 0 <= self._shard_size <= 32:
+                raise NmapRuntimeException(f"Invalid shard size {self._shard_size}, must be between 0 and 32")
 
-        self._client = NmapClient()
+        try:
+            self.cache_ttl = max(float(properties.get(self.Properties.CACHE_TTL) or 0), 0)
+        except ValueError:
+            raise NmapRuntimeException(f"Invalid cache TTL {properties.get(self.Properties.CACHE_TTL)}")
 
     @override
-    def run(self, ctx: context.Context):
-        cmd = NmapCommandBuilder().build_from_options(self._options)
+    async def stream(self, ctx: context.Context, channels: dict[str, plugins_models.Channel]):
+        # Hosts are streamed as nmap reports them, so that tasks consuming them can start before the sweep is done
+        up_hosts = channels["upHosts"]
+        network = ipaddress.IPv4Network(self._options.target[0])
+        if self._shard_size is None or self._shard_size <= network.prefixlen:
+            async for host in self._discover(network):
+                up_hosts.put(host)
+            return
+
+        # Shards are scanned concurrently but merged in network order, the window bounds how many are in flight
+        window = collections.deque()
+        try:
+            for shard in network.subnets(new_prefix=self._shard_size):
+                window.append(asyncio.create_task(self._discover_all(shard)))
+                if len(window) >= 2 * nmap_client.MAX_PROCESSES:
+                    for host in await window.popleft():
+                        up_hosts.put(host)
+            while window:
+                for host in await window.popleft():
+                    up_hosts.put(host)
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+
+    async def _discover(self, network: ipaddress.IPv4Network) -> AsyncIterator[str]:
+        options = dataclasses.replace(self._options, target=(str(network), TargetType.IPv4NETWORK))
+        cmd = NmapCommandBuilder().build_from_options(options)
         self.add_step(cmd)
-        hosts = self._client.scan(cmd, options=self._options)
-        return {
-            "upHosts": [host.get("ip") for host in hosts if host.get("ip") is not None],
-        }
+        async for host in NmapClient(timeout=self._timeout).scan(cmd, options=options):
+            if host.ip is not None:
+                yield host.ip
+
+    async def _discover_all(self, network: ipaddress.IPv4Network) -> list[str]:
+        return [host async for host in self._discover(network)]
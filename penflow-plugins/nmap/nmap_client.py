@@ -1,89 +1,239 @@
-import io
+from typing import AsyncIterator
+import asyncio
+import dataclasses
+import ipaddress
+import os
 import shlex
-import subprocess
+import signal
+import tempfile
+import weakref
 import xml.etree.ElementTree as ET
 
+import dotenv
+
+from . import exceptions
+from .nmap_cmd_builder import NmapCommandBuilder
 from .nmap_options import NmapOptions, PortScanTechnique
+from .nmap_results import NmapHost, NmapOs, NmapPort, PortState, intern
+
+
+config = dotenv.dotenv_values(".env")
+
+MAX_PROCESSES = int(config.get("NMAP_MAX_PROCESSES", 4))  # Concurrent nmap processes per worker
+DEFAULT_TIMEOUT = float(config.get("NMAP_TIMEOUT", 3600))  # Seconds
+BATCH_SIZE = int(config.get("NMAP_BATCH_SIZE", 64))  # Targets per batched scan, 1 disables batching
+BATCH_WINDOW = float(config.get("NMAP_BATCH_WINDOW", 0.05))  # Seconds scans wait for others to join their batch
+
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+_batchers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, "NmapBatcher"] = weakref.WeakKeyDictionary()
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    # Every scan of the worker shares the same limit, semaphores can only be used within the loop they were created on
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_PROCESSES)
+    return semaphore
+
+
+def get_batcher() -> "NmapBatcher":
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = NmapBatcher()
+    return batcher
 
 
 class NmapClient:
 
-    def __init__(self):
+    def __init__(self, timeout: float | None = None):
         self._options: NmapOptions | None = None
+        self._timeout = float(timeout) if timeout else DEFAULT_TIMEOUT
 
-    def scan(self, command: str, options: NmapOptions):
+    async def scan(self, command: str, options: NmapOptions) -> AsyncIterator[NmapHost]:
         self._options = options
+        async with get_semaphore():
+            deadline = asyncio.get_running_loop().time() + self._timeout
+            # Stderr is spooled to a file, a pipe could fill up and block nmap while its stdout is being read
+            with tempfile.TemporaryFile() as stderr:
+                try:
+                    # Nmap runs in its own process group, so that its children are killed along with it
+                    process = await asyncio.create_subprocess_exec(
+                        *shlex.split(command),
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=stderr,
+                        start_new_session=True
+                    )
+                except FileNotFoundError:
+                    raise exceptions.NmapNotFoundException()
+
+                try:
+                    # Hosts are parsed as nmap reports them instead of once the whole scan is done
+                    parser = ET.XMLPullParser(events=("start", "end"))
+                    root = None
+                    while chunk := await self._read(process, deadline):
+                        parser.feed(chunk)
+                        for event, element in parser.read_events():
+                            if root is None:
+                                root = element
+                            if event == "end" and element.tag == "host":
+                                yield self._process_host(element)
+                                # Drop parsed hosts so that memory does not grow with the size of the network
+                                root.clear()
+
+                    await process.wait()
+                    if process.returncode != 0:
+                        stderr.seek(0)
+                        raise exceptions.NmapProcessException(process.returncode, stderr.read().decode(errors="replace"))
+                    try:
+                        parser.close()
+                    except ET.ParseError as e:
+                        raise exceptions.NmapRuntimeException(f"Malformed nmap output, {e}")
+                finally:
+                    # Timed out, cancelled or the caller stopped consuming hosts before nmap was done
+                    if process.returncode is None:
+                        try:
+                            os.killpg(process.pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                        # Draining the pipe lets the transport close, otherwise it outlives the scan
+                        await process.communicate()
+
+    async def _read(self, process: asyncio.subprocess.Process, deadline: float) -> bytes:
         try:
-            process = subprocess.run(
-                shlex.split(command),
-                capture_output=True,
-                check=True
+            return await asyncio.wait_for(
+                process.stdout.read(64 * 1024),
+                max(deadline - asyncio.get_running_loop().time(), 0)
             )
-            return self._process_output(process.stdout)
-        except FileNotFoundError as e:
-            print(e)
-        except subprocess.CalledProcessError as e:
-            print(e.returncode)
-            print(e.stderr)
-            print(e.stdout)
-        except subprocess.TimeoutExpired as e:
-            print(e)
-
-    def _process_output(self, output: bytes) -> list:
-        hosts = []
-        for event, element in ET.iterparse(io.BytesIO(output)):
-            if element.tag == "host":
-                host_mac = {}
-                host_hostnames = []
-                host_os = []
-                host_ports = []
-
-                addresses = element.findall("address")
-                for address in addresses:
-                    address_type = address.get("addrtype")
-                    match address_type:
-                        case "ipv4":
-                            host_ip = address.get("addr")
-                        case "mac":
-                            host_mac = {
-                                "address": address.get("addr"),
-                                "vendor": address.get("vendor")
-                            }
-
-                hostnames = element.find("hostnames").findall("hostname")
-                for hostname in hostnames:
-                    host_hostnames.append({
-                        "name": hostname.get("name"),
-                        "type": hostname.get("type")
-                    })
-
-                if self._options.os_detection:
-                    os_list = element.find("os").findall("osmatch")
-                    for os_match in os_list:
-                        cpe_list = [cpe.findtext("cpe") for cpe in os_match.findall("osclass")]
-                        host_os.append({
-                            "name": os_match.get("name"),
-                            "accuracy": os_match.get("accuracy"),
-                            "cpe": cpe_list
-                        })
-
-                if self._options.port_scan_technique != PortScanTechnique.DISABLED:
-                    ports = element.find("ports").findall("port")
-                    for port in ports:
-                        host_ports.append({
-                            "protocol": port.get("protocol"),
-                            "port": port.get("portid"),
-                            "state": port.find("state").get("state"),
-                            "service": port.find("service").get("name")
-                        })
-
-                hosts.append({
-                    "ip": host_ip,
-                    "hostnames": host_hostnames,
-                    "mac": host_mac,
-                    "ports": host_ports,
-                    "os": host_os
-                })
-
-                element.clear()
-        return hosts
+        except asyncio.TimeoutError:
+            raise exceptions.NmapTimeoutException(self._timeout)
+
+    def _process_host(self, element: ET.Element) -> NmapHost:
+        host_ip = None
+        host_mac = None
+        host_hostnames = []
+        host_os = []
+        host_ports = []
+
+        addresses = element.findall("address")
+        for address in addresses:
+            address_type = address.get("addrtype")
+            match address_type:
+                case "ipv4":
+                    host_ip = address.get("addr")
+                case "mac":
+                    host_mac = (address.get("addr"), intern(address.get("vendor")))
+
+        hostnames = element.find("hostnames").findall("hostname")
+        for hostname in hostnames:
+            host_hostnames.append((hostname.get("name"), intern(hostname.get("type"))))
+
+        if self._options.os_detection:
+            os_list = element.find("os").findall("osmatch")
+            for os_match in os_list:
+                cpe_list = tuple(intern(cpe.findtext("cpe")) for cpe in os_match.findall("osclass"))
+                host_os.append(NmapOs(
+                    name=intern(os_match.get("name")),
+                    accuracy=int(os_match.get("accuracy")),
+                    cpe=cpe_list
+                ))
+
+        if self._options.port_scan_technique != PortScanTechnique.DISABLED:
+            ports = element.find("ports").findall("port")
+            for port in ports:
+                service = port.find("service")
+                host_ports.append(NmapPort(
+                    protocol=intern(port.get("protocol")),
+                    port=int(port.get("portid")),
+                    state=PortState(port.find("state").get("state")),
+                    service=intern(service.get("name")) if service is not None else None
+                ))
+
+        return NmapHost(
+            ip=host_ip,
+            hostnames=tuple(host_hostnames),
+            mac=host_mac,
+            ports=tuple(host_ports),
+            os=tuple(host_os)
+        )
+
+
+@dataclasses.dataclass
+class NmapBatch:
+    options: NmapOptions
+    timeout: float | None
+    futures: dict[str, list[asyncio.Future]] = dataclasses.field(default_factory=dict)  # By target address
+    timer: asyncio.TimerHandle | None = None
+    task: asyncio.Task | None = None
+
+
+class NmapBatcher:
+
+    def __init__(self, size: int = BATCH_SIZE, window: float = BATCH_WINDOW):
+        self._size = size
+        self._window = window
+        self._batches: dict[tuple, NmapBatch] = {}
+
+    async def scan(self, options: NmapOptions, timeout: float | None = None) -> NmapHost | None:
+        # Concurrent scans with the same options are coalesced into a single nmap run over all their targets
+        key = (
+            options.target[1],
+            options.port_ranges,
+            options.port_scan_technique,
+            options.host_discovery_technique,
+            options.os_detection,
+            options.dns_resolution,
+            timeout,
+        )
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = NmapBatch(options=options, timeout=timeout)
+            batch.timer = asyncio.get_running_loop().call_later(self._window, self._flush, key)
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._on_scan_done(batch))
+        batch.futures.setdefault(str(ipaddress.ip_address(options.target[0])), []).append(future)
+        if len(batch.futures) >= self._size:
+            self._flush(key)
+
+        # Cancelling the scan only cancels its own future, the batch goes on while other scans await it
+        return await future
+
+    def _flush(self, key: tuple):
+        batch = self._batches.pop(key)
+        batch.timer.cancel()
+        if self._is_done(batch):
+            return
+        batch.task = asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch: NmapBatch):
+        try:
+            # Results are grouped by host, each one is handed over to the scan that requested it as soon as nmap reports
+            # it. Every scan of the batch asked for the same timeout, which starts once nmap is launched as for a single
+            # target, so hosts reported by then keep their results and only the remaining ones time out
+            command = NmapCommandBuilder().build_from_options(batch.options, targets=list(batch.futures))
+            async for host in NmapClient(timeout=batch.timeout).scan(command, options=batch.options):
+                for future in batch.futures.get(host.ip, []):
+                    if not future.done():
+                        future.set_result(host)
+        except Exception as e:
+            for futures in batch.futures.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+        else:
+            # Targets nmap did not report on are down
+            for futures in batch.futures.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+
+    def _on_scan_done(self, batch: NmapBatch):
+        # Stop nmap once every target has been reported on or is no longer awaited
+        if batch.task is not None and not batch.task.done() and self._is_done(batch):
+            batch.task.cancel()
+
+    @staticmethod
+    def _is_done(batch: NmapBatch) -> bool:
+        return all(future.done() for futures in batch.futures.values() for future in futures)
@@ -22,10 +22,14 @@ class NmapCommandBuilder:
         self._target = target
         return self
 
+    def set_targets(self, targets: list[str], target_type: TargetType) -> Self:
+        for target in targets:
+            self.set_target(target, target_type)
+        self._target = " ".join(targets)
+        return self
+
     def set_port_ranges(self, port_ranges: str) -> Self:
-        clean_port_ranges = port_ranges.replace(" ", "")
-        utils.validate_port_ranges(clean_port_ranges)
-        self._command += f" -p {clean_port_ranges}"
+        self._command += f" -p {utils.validate_port_ranges(port_ranges)}"
         return self
 
     def set_port_scan_technique(self, port_scan_technique: str) -> Self:
@@ -77,11 +81,12 @@ class NmapCommandBuilder:
             raise ValueError("Invalid command, target is not set")
         return self._command + f" {self._target} -oX -"
 
-    def build_from_options(self, options: NmapOptions) -> str:
-        cmd_builder = (
-            self.reset()
-            .set_target(*options.target)
-        )
+    def build_from_options(self, options: NmapOptions, targets: list[str] | None = None) -> str:
+        cmd_builder = self.reset()
+        if targets is not None:
+            cmd_builder.set_targets(targets, options.target[1])
+        else:
+            cmd_builder.set_target(*options.target)
 
         if options.port_ranges is not None:
             cmd_builder.set_port_ranges(options.port_ranges)
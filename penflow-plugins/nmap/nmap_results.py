@@ -0,0 +1,107 @@
+from typing import Any, Self, override
+import dataclasses
+import enum
+import sys
+
+from penflowexecutor.models import serializable
+
+
+class PortState(enum.StrEnum):
+    OPEN = "open"
+    CLOSED = "closed"
+    FILTERED = "filtered"
+    UNFILTERED = "unfiltered"
+    OPEN_FILTERED = "open|filtered"
+    CLOSED_FILTERED = "closed|filtered"
+
+
+def intern(value: str | None) -> str | None:
+    # Protocols, services and vendors repeat across hosts, a single copy of each is kept
+    return sys.intern(value) if value is not None else None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class NmapPort(serializable.ISerializable):
+    protocol: str
+    port: int
+    state: PortState
+    service: str | None
+
+    @classmethod
+    @override
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            protocol=intern(data["protocol"]),
+            port=int(data["port"]),
+            state=PortState(data["state"]),
+            service=intern(data.get("service")),
+        )
+
+    @override
+    def to_dict(self, skip: list[str] | None = None) -> dict:
+        data = {
+            "protocol": self.protocol,
+            "port": str(self.port),
+            "state": str(self.state),
+            "service": self.service,
+        }
+
+        return {k: v for k, v in data.items() if k not in skip} if skip is not None else data
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class NmapOs(serializable.ISerializable):
+    name: str
+    accuracy: int
+    cpe: tuple[str, ...] = ()
+
+    @classmethod
+    @override
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            name=intern(data["name"]),
+            accuracy=int(data["accuracy"]),
+            cpe=tuple(intern(cpe) for cpe in data.get("cpe", [])),
+        )
+
+    @override
+    def to_dict(self, skip: list[str] | None = None) -> dict:
+        data = {
+            "name": self.name,
+            "accuracy": str(self.accuracy),
+            "cpe": list(self.cpe),
+        }
+
+        return {k: v for k, v in data.items() if k not in skip} if skip is not None else data
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class NmapHost(serializable.ISerializable):
+    ip: str | None
+    hostnames: tuple[tuple[str, str], ...] = ()  # Name and type
+    mac: tuple[str, str | None] | None = None  # Address and vendor
+    ports: tuple[NmapPort, ...] = ()
+    os: tuple[NmapOs, ...] = ()
+
+    @classmethod
+    @override
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            ip=data.get("ip"),
+            hostnames=tuple((hostname["name"], intern(hostname["type"])) for hostname in data.get("hostnames", [])),
+            mac=(data["mac"]["address"], intern(data["mac"].get("vendor"))) if data.get("mac") else None,
+            ports=tuple(NmapPort.from_dict(port) for port in data.get("ports", [])),
+            os=tuple(NmapOs.from_dict(os) for os in data.get("os", [])),
+        )
+
+    @override
+    def to_dict(self, skip: list[str] | None = None) -> dict:
+        data = {
+            "ip": self.ip,
+            "hostnames": [{"name": name, "type": type} for name, type in self.hostnames],
+            "mac": {"address": self.mac[0], "vendor": self.mac[1]} if self.mac is not None else {},
+            "ports": [port.to_dict() for port in self.ports],
+            "os": [os.to_dict() for os in self.os],
+        }
+
+        return {k: v for k, v in data.items() if k not in skip} if skip is not None else data
@@ -0,0 +1,116 @@
+from typing import Iterable, Iterator, Self
+import bisect
+import dataclasses
+import re
+
+from . import exceptions
+
+
+MIN_PORT = 0
+MAX_PORT = 65535
+
+PORT_RANGE_PATTERN = re.compile(r"\d{1,5}(-\d{1,5})?")  # 80; 1-1024
+
+
+@dataclasses.dataclass(frozen=True)
+class PortRanges:
+    # Sorted, disjoint and non-adjacent inclusive intervals, operations work on intervals instead of single ports
+    intervals: tuple[tuple[int, int], ...] = ()
+
+    @classmethod
+    def parse(cls, port_ranges: str) -> Self:
+        intervals = []
+        # Blanks are only allowed around the separators, "80 443" is not a single port
+        for port_range in (port_range.strip() for port_range in port_ranges.split(",")):
+            if not PORT_RANGE_PATTERN.fullmatch(port_range):
+                raise exceptions.NmapRuntimeException(f"Invalid port ranges {port_ranges}")
+            port_start, _, port_end = port_range.partition("-")
+            port_start, port_end = int(port_start), int(port_end or port_start)
+            if port_start > MAX_PORT or port_end > MAX_PORT:
+                raise exceptions.NmapRuntimeException(f"Invalid port, bigger than {MAX_PORT}")
+            if port_start > port_end:
+                raise exceptions.NmapRuntimeException("Invalid range, start > end")
+            intervals.append((port_start, port_end))
+
+        # Once sorted, a range overlaps another one only if it starts before the previous one ends
+        intervals.sort()
+        for (_, previous_end), (port_start, _) in zip(intervals, intervals[1:]):
+            if port_start <= previous_end:
+                raise exceptions.NmapRuntimeException(f"Invalid port, repeated {port_start}")
+
+        return cls.from_intervals(intervals)
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[tuple[int, int]]) -> Self:
+        merged = []
+        for port_start, port_end in sorted(intervals):
+            if merged and port_start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], port_end))
+            else:
+                merged.append((port_start, port_end))
+        return cls(tuple(merged))
+
+    def union(self, other: "PortRanges") -> "PortRanges":
+        return self.from_intervals(self.intervals + other.intervals)
+
+    def subtract(self, other: "PortRanges") -> "PortRanges":
+        intervals = []
+        removed = iter(other.intervals)
+        removed_interval = next(removed, None)
+        for port_start, port_end in self.intervals:
+            # Both sides are sorted, so removed intervals that end before this one can be skipped for good
+            while removed_interval is not None and removed_interval[1] < port_start:
+                removed_interval = next(removed, None)
+            while removed_interval is not None and removed_interval[0] <= port_end:
+                if removed_interval[0] > port_start:
+                    intervals.append((port_start, removed_interval[0] - 1))
+                port_start = removed_interval[1] + 1
+                if removed_interval[1] > port_end:
+                    break
+                removed_interval = next(removed, None)
+            if port_start <= port_end:
+                intervals.append((port_start, port_end))
+        return PortRanges(tuple(intervals))
+
+    def split(self, shards: int) -> list["PortRanges"]:
+        # Shards hold the same number of ports give or take one, an interval is cut wherever a shard is full
+        if shards < 1:
+            raise exceptions.NmapRuntimeException(f"Invalid number of shards {shards}")
+        size, remainder = divmod(len(self), shards)
+        result = []
+        intervals = iter(self.intervals)
+        interval = next(intervals, None)
+        for shard in range(min(shards, len(self))):
+            missing = size + (shard < remainder)
+            shard_intervals = []
+            while missing > 0:
+                port_start, port_end = interval
+                port_last = min(port_end, port_start + missing - 1)
+                shard_intervals.append((port_start, port_last))
+                missing -= port_last - port_start + 1
+                interval = (port_last + 1, port_end) if port_last < port_end else next(intervals, None)
+            result.append(PortRanges(tuple(shard_intervals)))
+        return result
+
+    def __or__(self, other: "PortRanges") -> "PortRanges":
+        return self.union(other)
+
+    def __sub__(self, other: "PortRanges") -> "PortRanges":
+        return self.subtract(other)
+
+    def __len__(self) -> int:
+        return sum(port_end - port_start + 1 for port_start, port_end in self.intervals)
+
+    def __iter__(self) -> Iterator[int]:
+        for port_start, port_end in self.intervals:
+            yield from range(port_start, port_end + 1)
+
+    def __contains__(self, port: int) -> bool:
+        index = bisect.bisect_right(self.intervals, (port, MAX_PORT + 1)) - 1
+        return index >= 0 and self.intervals[index][1] >= port
+
+    def __str__(self) -> str:
+        return ",".join(
+            str(port_start) if port_start == port_end else f"{port_start}-{port_end}"
+            for port_start, port_end in self.intervals
+        )
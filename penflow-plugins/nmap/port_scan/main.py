@@ -1,26 +1,34 @@
 from typing import Any, override
+import asyncio
+import contextlib
+import dataclasses
 import enum
 
 from penflowexecutor.adapters import plugins
 from penflowexecutor.models import plugins as plugins_models
 from penflowexecutor.services import context
 
+from nmap import nmap_client, utils
+from nmap.exceptions import NmapRuntimeException
 from nmap.nmap_client import NmapClient
 from nmap.nmap_cmd_builder import NmapCommandBuilder
 from nmap.nmap_options import PortScanTechnique, NmapOptions, TargetType
+from nmap.nmap_results import NmapHost
 
 
 plugin_registry = plugins.PluginRegistry()
 
 
 @plugin_registry.register("nmap.port_scan")
-class NmapPortScan(plugins_models.RunnableTask):
-
+class NmapPortScan(plugins_models.AsyncRunnableTask):
     class Properties(enum.StrEnum):
         HOST = "host"  # Required
         PORTS = "ports"  # Required
         SCAN_TECHNIQUE = "scanTechnique"  # Optional, default TCP_SYN
         OS_DETECTION = "osDetection"  # Optional, default False
+        TIMEOUT = "timeout"  # Optional, default NMAP_TIMEOUT
+        SHARDS = "shards"  # Optional, number of port range chunks scanned concurrently, default 1
+        CACHE_TTL = "cacheTtl"  # Optional, seconds results are reused for the same properties, default 0 (disabled)
 
     def __init__(self, properties: dict[str, Any]):
         super().__init__()
@@ -31,20 +39,66 @@ class NmapPortScan(plugins_models.RunnableTask):
             os_detection=properties.get(self.Properties.OS_DETECTION, False),
         )
 
-        self._client = NmapClient()
+        self._timeout = properties.get(self.Properties.TIMEOUT)
+
+        try:
+            self._shards = max(int(properties.get(self.Properties.SHARDS) or 1), 1)
+        except ValueError:
+            raise NmapRuntimeException(f"Invalid number of shards {properties.get(self.Properties.SHARDS)}")
+
+        try:
+            self.cache_ttl = max(float(properties.get(self.Properties.CACHE_TTL) or 0), 0)
+        except ValueError:
+            raise NmapRuntimeException(f"Invalid cache TTL {properties.get(self.Properties.CACHE_TTL)}")
 
     @override
-    def run(self, ctx: context.Context):
+    async def run(self, ctx: context.Context):
         output = {
             "address": self._options.target[0],
             "discoveredPorts": [],
             "os": "",
         }
 
-        cmd = NmapCommandBuilder().build_from_options(self._options)
-        self.add_step(cmd)
-        host = next(iter(self._client.scan(cmd, options=self._options)), None)
-        if host is not None:
-            output["discoveredPorts"] = host.get("ports", [])
-            output["os"] = max(host.get("os"), key=lambda os: os.get("accuracy")) if len(host.get("os")) > 0 else ""
+        hosts = [host for host in await self._scan_shards() if host is not None]
+        if len(hosts) > 0:
+            # Shards do not overlap, ports are only deduplicated in case nmap reports one twice
+            ports = {(port.protocol, port.port): port for host in hosts for port in host.ports}
+            output["discoveredPorts"] = sorted(ports.values(), key=lambda port: port.port)
+            os_list = [os for host in hosts for os in host.os]
+            output["os"] = max(os_list, key=lambda os: os.accuracy) if len(os_list) > 0 else ""
         return output
+
+    async def _scan_shards(self) -> list[NmapHost | None]:
+        if self._shards == 1 or self._options.port_ranges is None:
+            return [await self._scan(self._options)]
+
+        # Each chunk of ports is scanned by its own nmap run, OS detection is only done once along with the first one
+        port_ranges = utils.validate_port_ranges(self._options.port_ranges)
+        shards = [
+            dataclasses.replace(
+                self._options,
+                port_ranges=str(shard),
+                os_detection=self._options.os_detection and index == 0
+            )
+            for index, shard in enumerate(port_ranges.split(self._shards))
+        ]
+        tasks = [asyncio.create_task(self._scan(options)) for options in shards]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _scan(self, options: NmapOptions) -> NmapHost | None:
+        # The step is the scan of this task alone, even when its target is scanned along with others
+        cmd = NmapCommandBuilder().build_from_options(options)
+        self.add_step(cmd)
+
+        if nmap_client.BATCH_SIZE > 1:
+            # Scans of other tasks running at the same time with the same options share a single nmap run
+            return await nmap_client.get_batcher().scan(options, timeout=self._timeout)
+
+        # Clients hold the options of their scan, so each concurrent shard gets its own
+        async with contextlib.aclosing(NmapClient(timeout=self._timeout).scan(cmd, options=options)) as hosts:
+            return await anext(hosts, None)